@@ -0,0 +1,90 @@
+"""Compare the native and spatial_egt backends of the spatial statistics
+
+Computes each statistic that has a native backend with both backends on
+processed samples, reporting the largest difference between them and the speedup.
+
+Expected usage:
+python3 -m benchmarks.compare_backends -dir data_type -time time (-n num_samples)
+    (-stats statistic ...)
+
+Where:
+data_type: the name of the directory in data/ containing the processed/ data
+time: the time step of the processed data
+num_samples: optional, the number of samples to compare on
+statistic: optional, the statistics to compare, defaults to all with a native backend
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_processing.processed_samples import list_processed, load_processed
+from spatial_database import NATIVE_STATISTICS, STATISTIC_PARAMS, get_statistic
+from spatial_egt.common import get_data_path
+
+
+def time_statistic(func, df, params):
+    """Get the value of a statistic and how long it took to compute, in seconds"""
+    start = time.perf_counter()
+    value = func(df, **params)
+    return value, time.perf_counter() - start
+
+
+def get_difference(value1, value2):
+    """Get the largest absolute difference between two statistic values"""
+    if value1 is None or value2 is None:
+        return 0.0 if value1 is None and value2 is None else np.inf
+    value1 = np.sort(np.ravel(np.asarray(value1, dtype=float)))
+    value2 = np.sort(np.ravel(np.asarray(value2, dtype=float)))
+    if value1.shape != value2.shape:
+        return np.inf
+    if len(value1) == 0:
+        return 0.0
+    return float(np.nanmax(np.abs(value1 - value2)))
+
+
+def main():
+    """Compare the backends of each statistic on processed samples"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-dir", "--data_type", type=str, default="in_silico")
+    parser.add_argument("-time", "--time", type=int, default=None)
+    parser.add_argument("-n", "--num_samples", type=int, default=10)
+    parser.add_argument("-stats", "--statistics", type=str, nargs="+", default=None)
+    args = parser.parse_args()
+
+    statistics = list(NATIVE_STATISTICS) if args.statistics is None else args.statistics
+    processed_data_path = get_data_path(args.data_type, "processed", args.time)
+    rows = []
+    for sample_path in list_processed(processed_data_path)[: args.num_samples]:
+        df = load_processed(sample_path)
+        for name in statistics:
+            params = STATISTIC_PARAMS.get(name, {})
+            native, native_time = time_statistic(get_statistic(name, "native"), df, params)
+            reference, reference_time = time_statistic(
+                get_statistic(name, "spatial_egt"), df, params
+            )
+            rows.append(
+                {
+                    "statistic": name,
+                    "sample": sample_path,
+                    "cells": len(df),
+                    "difference": get_difference(native, reference),
+                    "native_s": native_time,
+                    "spatial_egt_s": reference_time,
+                }
+            )
+
+    df = pd.DataFrame(rows)
+    summary = df.groupby("statistic").agg(
+        max_difference=("difference", "max"),
+        native_s=("native_s", "sum"),
+        spatial_egt_s=("spatial_egt_s", "sum"),
+    )
+    summary["speedup"] = summary["spatial_egt_s"] / summary["native_s"]
+    print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare the accuracy and speed of the Wasserstein methods
+
+Computes the Wasserstein distance of processed samples with each method of
+data_processing/spatial_statistics/transport.py, reporting the error relative
+to the exact method and the time taken.
+
+Expected usage:
+python3 -m benchmarks.compare_wasserstein -dir data_type -time time (-n num_samples)
+    (-grid grid_size) (-reg reg) (-projections num_projections)
+
+Where:
+data_type: the name of the directory in data/ containing the processed/ data
+time: the time step of the processed data
+num_samples: optional, the number of samples to compare on
+grid_size: optional, the side length of the bins of the histogram and sinkhorn methods
+reg: optional, the relative entropic regularization of the sinkhorn method
+num_projections: optional, the number of projections of the sliced method
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.compare_backends import time_statistic
+from data_processing.processed_samples import list_processed, load_processed
+from data_processing.spatial_statistics.transport import wasserstein
+from spatial_egt.common import get_data_path
+
+
+def main():
+    """Compare each Wasserstein method to the exact distance on processed samples"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-dir", "--data_type", type=str, default="in_silico")
+    parser.add_argument("-time", "--time", type=int, default=None)
+    parser.add_argument("-n", "--num_samples", type=int, default=10)
+    parser.add_argument("-grid", "--grid_size", type=float, default=10)
+    parser.add_argument("-reg", "--reg", type=float, default=0.01)
+    parser.add_argument("-projections", "--num_projections", type=int, default=100)
+    args = parser.parse_args()
+
+    methods = {
+        "histogram": {"grid_size": args.grid_size},
+        "sinkhorn": {"grid_size": args.grid_size, "reg": args.reg},
+        "sliced": {"num_projections": args.num_projections},
+    }
+    processed_data_path = get_data_path(args.data_type, "processed", args.time)
+    rows = []
+    for sample_path in list_processed(processed_data_path)[: args.num_samples]:
+        df = load_processed(sample_path)
+        exact, exact_time = time_statistic(wasserstein, df, {"method": "exact"})
+        if exact is None:
+            continue
+        for method, options in methods.items():
+            value, method_time = time_statistic(wasserstein, df, {"method": method, **options})
+            rows.append(
+                {
+                    "method": method,
+                    "sample": sample_path,
+                    "cells": len(df),
+                    "relative_error": (value - exact) / exact if exact > 0 else np.nan,
+                    "exact_s": exact_time,
+                    "method_s": method_time,
+                }
+            )
+
+    df = pd.DataFrame(rows)
+    summary = df.groupby("method").agg(
+        mean_relative_error=("relative_error", "mean"),
+        max_abs_relative_error=("relative_error", lambda e: e.abs().max()),
+        exact_s=("exact_s", "sum"),
+        method_s=("method_s", "sum"),
+    )
+    summary["speedup"] = summary["exact_s"] / summary["method_s"]
+    print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
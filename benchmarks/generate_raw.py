@@ -0,0 +1,150 @@
+"""Generate synthetic EGT_HAL raw data to benchmark the processing pipeline
+
+Writes raw/{experiment}/{config}/{config}.json and
+raw/{experiment}/{config}/{seed}/2Dcoords.csv in the layout the ABM writes,
+with cells placed uniformly at random and the proportion resistant drifting
+across 0.5 over time, so every in-silico processing step has data to work on.
+
+Expected usage:
+python3 -m benchmarks.generate_raw -dir data_type (-configs n) (-reps n) (-x x) (-y y)
+    (-cells n) (-freq write_freq) (-end end_time) (-seed seed)
+
+Where:
+data_type: the name of the directory in data/ to write the raw/ data to
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from spatial_egt.common import get_data_path
+
+
+def make_config(rng, grid_x, grid_y, num_cells, write_freq, end_time, seed):
+    """Get an EGT_HAL config with a random payoff matrix and initial proportion resistant"""
+    payoff = rng.uniform(0, 0.1, size=(2, 4)).round(3)
+    config = {
+        "A": payoff[0, 0],
+        "B": payoff[0, 1],
+        "C": payoff[0, 2],
+        "D": payoff[0, 3],
+        "A1": payoff[1, 0],
+        "B1": payoff[1, 1],
+        "C1": payoff[1, 2],
+        "D1": payoff[1, 3],
+        "numCells": num_cells,
+        "proportionResistant": round(rng.uniform(0.2, 0.8), 3),
+        "x": grid_x,
+        "y": grid_y,
+        "interactionRadius": 2,
+        "reproductionRadius": 1,
+        "turnover": 0.009,
+        "writeFreq": write_freq,
+        "numTicks": end_time,
+        "seed": seed,
+        "grid_expansion": 1,
+    }
+    return {key: value.item() if hasattr(value, "item") else value for key, value in config.items()}
+
+
+def make_coords(rng, config):
+    """Get the coordinates of every written time step of a single replicate
+
+    :param rng: the random generator to place cells with
+    :type rng: numpy.random.Generator
+    :param config: the config of the replicate
+    :type config: dict
+    :return: the coordinates with model, time, type, x, and y columns
+    :rtype: Pandas DataFrame
+    """
+    times = np.arange(0, config["numTicks"] + 1, config["writeFreq"])
+    num_cells = config["numCells"]
+    start = config["proportionResistant"]
+    proportion_resistant = np.linspace(start, 1 - start, len(times))
+    time = np.repeat(times, num_cells)
+    resistant = rng.random(len(time)) < np.repeat(proportion_resistant, num_cells)
+    return pd.DataFrame(
+        {
+            "model": "2D",
+            "time": time,
+            "type": resistant.astype(np.uint8),
+            "x": rng.integers(0, config["x"], len(time)),
+            "y": rng.integers(0, config["y"], len(time)),
+        }
+    )
+
+
+def generate_raw(
+    data_type,
+    experiment="HAL",
+    num_configs=10,
+    num_replicates=2,
+    grid_x=100,
+    grid_y=100,
+    num_cells=1000,
+    write_freq=10,
+    end_time=100,
+    seed=42,
+):
+    """Write a synthetic raw data tree
+
+    :return: the number of coordinate rows written
+    :rtype: int
+    """
+    rng = np.random.default_rng(seed)
+    raw_data_path = get_data_path(data_type, "raw")
+    num_rows = 0
+    for c in range(num_configs):
+        config_name = str(c)
+        config_path = f"{raw_data_path}/{experiment}/{config_name}"
+        os.makedirs(config_path, exist_ok=True)
+        config = make_config(rng, grid_x, grid_y, num_cells, write_freq, end_time, c)
+        with open(f"{config_path}/{config_name}.json", "w", encoding="UTF-8") as f:
+            json.dump(config, f)
+        for rep in range(num_replicates):
+            os.makedirs(f"{config_path}/{rep}", exist_ok=True)
+            df = make_coords(rng, config)
+            df.to_csv(f"{config_path}/{rep}/2Dcoords.csv", index=False)
+            num_rows += len(df)
+    return num_rows
+
+
+def add_arguments(parser):
+    """Add the size of the generated data as arguments"""
+    parser.add_argument("-exp", "--experiment", type=str, default="HAL")
+    parser.add_argument("-configs", "--num_configs", type=int, default=10)
+    parser.add_argument("-reps", "--num_replicates", type=int, default=2)
+    parser.add_argument("-x", "--grid_x", type=int, default=100)
+    parser.add_argument("-y", "--grid_y", type=int, default=100)
+    parser.add_argument("-cells", "--num_cells", type=int, default=1000)
+    parser.add_argument("-freq", "--write_freq", type=int, default=10)
+    parser.add_argument("-end", "--end_time", type=int, default=100)
+    parser.add_argument("-seed", "--seed", type=int, default=42)
+
+
+def main():
+    """Generate a synthetic raw data tree"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-dir", "--data_type", type=str, default="in_silico_benchmark")
+    add_arguments(parser)
+    args = parser.parse_args()
+    num_rows = generate_raw(
+        args.data_type,
+        args.experiment,
+        args.num_configs,
+        args.num_replicates,
+        args.grid_x,
+        args.grid_y,
+        args.num_cells,
+        args.write_freq,
+        args.end_time,
+        args.seed,
+    )
+    print(f"Wrote {num_rows} coordinate rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Time each in-silico processing entry point on synthetic raw data
+
+Generates a synthetic EGT_HAL raw data tree in a working directory, then runs
+each processing entry point on it in a subprocess, reporting its wall time,
+peak resident memory, and throughput. Results can be appended to a csv,
+labeled with the current commit, to compare throughput across commits.
+
+Expected usage:
+python3 -m benchmarks.run_benchmarks (-work work_dir) (-workers n) (-only name ...)
+    (-results results.csv) followed by any of the benchmarks.generate_raw size arguments
+
+Where:
+work_dir: the directory to generate data in and run the entry points from,
+    defaults to a temporary directory
+workers: the number of processes the entry points that support it use
+name: the names of the benchmarks to run, defaults to all
+results: optional, a csv to append the results to
+"""
+
+import argparse
+from datetime import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.generate_raw import add_arguments
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_TYPE = "in_silico_benchmark"
+
+
+def get_benchmarks(args):
+    """Get the name, module arguments, and throughput unit of each benchmark, in run order
+
+    Benchmarks that read the coordinate files are measured in raw rows,
+    the others in configs. The parquet benchmarks run after the conversion.
+    """
+    workers = str(args.workers)
+    end = str(args.end_time)
+    return [
+        ("payoff", ["data_processing.in_silico.raw_to_processed_payoff", "-dir", DATA_TYPE,
+                    "-workers", workers, "-force"], "configs"),
+        ("catalog", ["data_processing.in_silico.catalog", "-dir", DATA_TYPE,
+                     "-workers", workers, "-rebuild"], "configs"),
+        ("payoff_catalog", ["data_processing.in_silico.raw_to_processed_payoff", "-dir", DATA_TYPE,
+                            "-catalog"], "configs"),
+        ("spatial_csv", ["data_processing.in_silico.raw_to_processed_spatial", "-dir", DATA_TYPE,
+                         "-time", end, "-workers", workers, "-force"], "rows"),
+        ("ps_csv", ["data_processing.in_silico.raw_to_processed_spatial_ps", DATA_TYPE,
+                    workers], "rows"),
+        ("drug_gradient_csv", ["data_processing.in_silico.drug_gradient", DATA_TYPE,
+                               str(args.grid_x // 2), end, workers], "rows"),
+        ("to_parquet", ["data_processing.in_silico.trajectories", "-dir", DATA_TYPE,
+                        "-overwrite"], "rows"),
+        ("spatial_parquet", ["data_processing.in_silico.raw_to_processed_spatial", "-dir",
+                             DATA_TYPE, "-time", end, "-workers", workers, "-force"], "rows"),
+        ("ps_parquet", ["data_processing.in_silico.raw_to_processed_spatial_ps", DATA_TYPE,
+                        workers], "rows"),
+    ]
+
+
+def run_benchmark(module_args, work_dir, log_path):
+    """Run an entry point in a subprocess and measure its resource use
+
+    :param module_args: the module to run and its arguments
+    :type module_args: list[str]
+    :param work_dir: the directory to run the module from
+    :type work_dir: str
+    :param log_path: the file to write the output of the module to
+    :type log_path: str
+    :return: the exit code, wall time in seconds, and peak RSS in MB
+        of the largest process among the entry point and its waited-for children
+    :rtype: tuple[int, float, float]
+    """
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_PATH, env.get("PYTHONPATH")]))
+    with open(log_path, "w", encoding="UTF-8") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m"] + module_args,
+            cwd=work_dir,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall_time = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in KB on Linux
+    return process.returncode, wall_time, rusage.ru_maxrss / 1024
+
+
+def get_commit():
+    """Get the current commit of the repository, if it is a git checkout"""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_PATH,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return result.stdout.strip()
+
+
+def main():
+    """Generate synthetic data and time each processing entry point on it"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-work", "--work_dir", type=str, default=None)
+    parser.add_argument("-workers", "--workers", type=int, default=1)
+    parser.add_argument("-only", "--only", type=str, nargs="+", default=None)
+    parser.add_argument("-results", "--results", type=str, default=None)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp()
+    work_dir = os.path.abspath(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    print(f"Working in {work_dir}")
+
+    size_args = ["-dir", DATA_TYPE, "-exp", args.experiment, "-configs", str(args.num_configs),
+                 "-reps", str(args.num_replicates), "-x", str(args.grid_x), "-y", str(args.grid_y),
+                 "-cells", str(args.num_cells), "-freq", str(args.write_freq),
+                 "-end", str(args.end_time), "-seed", str(args.seed)]
+    code, wall_time, _ = run_benchmark(
+        ["benchmarks.generate_raw"] + size_args, work_dir, f"{work_dir}/generate_raw.log"
+    )
+    if code != 0:
+        print(f"Generating data failed, see {work_dir}/generate_raw.log")
+        return
+    num_times = args.end_time // args.write_freq + 1
+    num_rows = args.num_configs * args.num_replicates * num_times * args.num_cells
+    units = {"configs": args.num_configs, "rows": num_rows}
+    print(f"Generated {num_rows} rows in {wall_time:.2f}s")
+
+    results = []
+    for name, module_args, unit in get_benchmarks(args):
+        if args.only is not None and name not in args.only:
+            continue
+        log_path = f"{work_dir}/{name}.log"
+        code, wall_time, peak_rss = run_benchmark(module_args, work_dir, log_path)
+        results.append(
+            {
+                "benchmark": name,
+                "exit_code": code,
+                "wall_time_s": round(wall_time, 3),
+                "peak_rss_mb": round(peak_rss, 1),
+                "unit": unit,
+                "per_second": round(units[unit] / wall_time, 1),
+            }
+        )
+        if code != 0:
+            print(f"{name} failed, see {log_path}")
+
+    df = pd.DataFrame(results)
+    print(df.to_string(index=False))
+    if args.results is not None:
+        df["commit"] = get_commit()
+        df["date"] = datetime.now().isoformat(timespec="seconds")
+        df["workers"] = args.workers
+        df["rows"] = num_rows
+        write_header = not os.path.exists(args.results)
+        df.to_csv(args.results, mode="a", header=write_header, index=False)
+
+
+if __name__ == "__main__":
+    main()
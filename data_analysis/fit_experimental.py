@@ -1,70 +1,90 @@
 """Fit ABM interaction and reproduction radii to experiment count data.
 
-Expected usage: python3 -m data_analysis.fit_experimental data_type (source) (sample_id)
+Expected usage: python3 -m data_analysis.fit_experimental data_type (source sample_id) (-catalog)
 
 Where:
 data_type: the name of the directory in data/ containing raw/ ABM data
 source: optional, the name of the source of the data
 sample_id: optional, a sample_id to visualize the fits on
+-catalog: optional, look up configs and runs in the catalog of data_type instead of
+    labels.csv and raw/, see data_processing.in_silico.catalog
 """
 
+import argparse
 import os
-import sys
 
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
+from data_processing.in_silico.catalog import query_configs, query_runs
+from data_processing.in_silico.trajectories import count_cell_types
+from data_processing.in_silico.trajectories import read_coords as read_trajectory
 from spatial_egt.common import get_data_path, theme_colors
 
 
-def read_coords(row, raw_data_path):
+def get_run_paths(source, sample, raw_data_path):
+    """Get the coordinate file of each seed of a sample by listing its directory"""
+    paths = []
+    for seed in os.listdir(f"{raw_data_path}/{source}/{sample}"):
+        path = f"{raw_data_path}/{source}/{sample}/{seed}/2Dcoords.csv"
+        if os.path.isfile(path):
+            paths.append(path)
+    return paths
+
+
+def read_coords(row, raw_data_path, run_paths=None):
     """Get the cell counts at each time step
 
     :param row: A row of the payoff dataframe
     :type row: Pandas Series
     :param raw_data_path: Path to the coordinate data
     :type raw_data_path: str
+    :param run_paths: the coordinate files of each (source, sample),
+        defaults to listing the sample directory
+    :type run_paths: dict[tuple[str, str], list[str]], optional
     :return: dataframe with cell counts
     :rtype: Pandas Dataframe
     """
     # Read coordinate file for the sample represented in the row
     source = row["source"]
     sample = row["sample"]
+    if run_paths is None:
+        paths = get_run_paths(source, sample, raw_data_path)
+    else:
+        paths = run_paths.get((source, sample), [])
     df = pd.DataFrame()
-    for seed in os.listdir(f"{raw_data_path}/{source}/{sample}"):
-        path = f"{raw_data_path}/{source}/{sample}/{seed}/2Dcoords.csv"
-        if not os.path.isfile(path):
-            continue
-        coords = pd.read_csv(path)
-        coords["seed"] = seed
+    for path in paths:
+        coords = read_trajectory(path, columns=["time", "type"])
         df = pd.concat([df, coords])
-    # Get the count of each cell type at each time step
-    types = [0, 1]
-    df = df[["seed", "model", "time", "type", "x"]]
-    counts = df.groupby(["model", "time", "type"]).size().reset_index(name="count")
-    times = df["time"].unique()
-    index = pd.MultiIndex.from_product([times, types], names=["time", "type"])
-    counts = counts.set_index(["time", "type"]).reindex(index, fill_value=0).reset_index()
-    row["Sensitive"] = list(counts[counts["type"] == 0]["count"].values)
-    row["Resistant"] = list(counts[counts["type"] == 1]["count"].values)
-    row["Time"] = sorted(list(df["time"].unique()))
+    # Get the count of each cell type at each time step, summed across seeds
+    counts = count_cell_types(df)
+    row["Sensitive"] = list(counts["sensitive"].values)
+    row["Resistant"] = list(counts["resistant"].values)
+    row["Time"] = list(counts["time"].values)
     return row
 
 
-def read_abm_data(data_type, source=None, sample_id=None):
+def read_abm_data(data_type, source=None, sample_id=None, use_catalog=False):
     raw_data_path = get_data_path(data_type, "raw")
-    data_path = get_data_path(data_type, ".")
-    df = pd.read_csv(f"{data_path}/labels.csv")
-    df["sample_id"] = df["sample"].str.split("-").str[0]
-    if source is not None:
-        df = df[(df["source"] == source)]
-    if sample_id is not None:
-        df = df[(df["sample_id"] == sample_id)]
-    df["radii"] = df["sample"].str.split("-").str[1]
+    if use_catalog:
+        df = query_configs(data_type, source=source, sample_id=sample_id)
+        df = df[df["game"] != "Unknown"]
+        df_runs = query_runs(data_type, source=source, sample_id=sample_id)
+        run_paths = df_runs.groupby(["source", "sample"])["path"].apply(list).to_dict()
+    else:
+        data_path = get_data_path(data_type, ".")
+        df = pd.read_csv(f"{data_path}/labels.csv")
+        df["sample_id"] = df["sample"].str.split("-").str[0]
+        if source is not None:
+            df = df[(df["source"] == source)]
+        if sample_id is not None:
+            df = df[(df["sample_id"] == sample_id)]
+        df["radii"] = df["sample"].str.split("-").str[1]
+        run_paths = None
 
-    abm_counts = df.apply(read_coords, axis=1, args=(raw_data_path,))
+    abm_counts = df.apply(read_coords, axis=1, args=(raw_data_path, run_paths))
     abm_counts["sample"] = abm_counts["sample_id"]
     abm_counts = abm_counts[["source", "sample", "radii", "Time", "Sensitive", "Resistant"]]
     df_abm = abm_counts.explode(["Time", "Sensitive", "Resistant"])
@@ -111,8 +131,8 @@ def read_exp_data(source=None, sample_id=None):
     return df_exp
 
 
-def visualize(data_type, source, sample_id):
-    df_abm = read_abm_data(data_type, source, sample_id)
+def visualize(data_type, source, sample_id, use_catalog=False):
+    df_abm = read_abm_data(data_type, source, sample_id, use_catalog)
     df_exp = read_exp_data(source, sample_id)
     df = pd.concat([df_exp, df_abm])
     df = df[df["Time"] <= 72]
@@ -161,8 +181,8 @@ def plot_agg_radii(save_loc, df, name, hue=None):
     fig.savefig(f"{save_loc}/tune_radii_{name}_{hue}.png", bbox_inches="tight")
 
 
-def fit(data_type):
-    df_abm = read_abm_data(data_type)
+def fit(data_type, use_catalog=False):
+    df_abm = read_abm_data(data_type, use_catalog=use_catalog)
     df_exp = read_exp_data()
 
     df_abm = df_abm[df_abm["Time"] <= 72]
@@ -233,9 +253,15 @@ def fit(data_type):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        fit(*sys.argv[1:])
-    elif len(sys.argv) == 4:
-        visualize(*sys.argv[1:])
+    parser = argparse.ArgumentParser()
+    parser.add_argument("data_type", type=str)
+    parser.add_argument("source", type=str, nargs="?", default=None)
+    parser.add_argument("sample_id", type=str, nargs="?", default=None)
+    parser.add_argument("-catalog", "--catalog", action="store_true")
+    args = parser.parse_args()
+    if args.source is None:
+        fit(args.data_type, args.catalog)
+    elif args.sample_id is not None:
+        visualize(args.data_type, args.source, args.sample_id, args.catalog)
     else:
         print("Please see the module docstring for usage instructions.")
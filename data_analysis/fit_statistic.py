@@ -4,6 +4,8 @@ import os
 import numpy as np
 import pandas as pd
 
+from data_processing.processed_to_statistics import evaluate_statistics
+from data_processing.statistic_cache import DEFAULT_CACHE_PATH, StatisticCache
 from spatial_egt.common import get_data_path
 from spatial_egt.data_processing.processed_to_statistic import get_statistic_calculation_arguments
 from spatial_database import STATISTIC_REGISTRY
@@ -13,17 +15,32 @@ def distance(row, stat):
     return np.linalg.norm(row[f"ABM {stat}"] - row[f"Exp {stat}"])
 
 
+def load_statistic(data_type, time, statistic_name, cache=None):
+    """Get a statistic of each processed sample
+
+    Reads the statistic saved by the statistics step, or, given a cache,
+    recalculates it from the processed samples through the statistic cache.
+    """
+    if cache is None:
+        return pd.read_pickle(f"data/{data_type}/{time}/statistics/{statistic_name}.pkl")
+    return evaluate_statistics(data_type, time, [statistic_name], cache=cache)[statistic_name]
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-abm_dir", "--abm_data_type", type=str, default="in_silico_fit")
     parser.add_argument("-exp_dir", "--exp_data_type", type=str, default="in_vitro_pc9")
     parser.add_argument("-time", "--time", type=int, default=72)
     parser.add_argument("-stat", "--statistic_name", type=str, default="CPCF_RS")
+    parser.add_argument("-recalculate", "--recalculate", action="store_true")
+    parser.add_argument("-cache", "--cache_path", type=str, default=DEFAULT_CACHE_PATH)
     args = parser.parse_args()
 
-    stat_path = f"{args.time}/statistics/{args.statistic_name}.pkl"
-    df_exp = pd.read_pickle(f"data/{args.exp_data_type}/{stat_path}")
-    df_abm = pd.read_pickle(f"data/{args.abm_data_type}/{stat_path}")
+    cache = StatisticCache(args.cache_path) if args.recalculate else None
+    df_exp = load_statistic(args.exp_data_type, args.time, args.statistic_name, cache)
+    df_abm = load_statistic(args.abm_data_type, args.time, args.statistic_name, cache)
+    if cache is not None:
+        cache.close()
 
     df_abm["params"] = df_abm["sample"].str.split("-").str[1]
     df_abm["Expansion"] = df_abm["params"].str.split("_").str[0]
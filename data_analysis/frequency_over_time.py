@@ -1,36 +1,54 @@
 """Plot ABM cell composition over time
 
-Expected usage: python3 -m data_analysis.frequency_over_time data_type source
+Expected usage: python3 -m data_analysis.frequency_over_time data_type source (-catalog)
 
 Where:
 data_type: the name of the directory in data/ containing raw/ coordinates
 source: the data source
+-catalog: optional, look up runs in the catalog of data_type instead of walking raw/,
+    see data_processing.in_silico.catalog
 """
 
+import argparse
 import os
-import sys
 
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
+from data_processing.in_silico.catalog import query_runs
+from data_processing.in_silico.trajectories import CELL_TYPES, count_cell_types, read_coords
 from spatial_egt.common import game_colors, get_data_path
 
 
-def main(data_type, source):
+def get_run_paths(data_type, source, use_catalog=False):
+    """Get the sample and coordinate file of each replicate of a source"""
+    if use_catalog:
+        df_runs = query_runs(data_type, source=source)
+        return list(df_runs[["sample", "path"]].itertuples(index=False, name=None))
     raw_data_path = get_data_path(data_type, "raw")
-    df = pd.DataFrame()
+    runs = []
     for sample in os.listdir(f"{raw_data_path}/{source}"):
         if os.path.isfile(f"{raw_data_path}/{source}/{sample}"):
             continue
         for rep in os.listdir(f"{raw_data_path}/{source}/{sample}"):
             if os.path.isfile(f"{raw_data_path}/{source}/{sample}/{rep}"):
                 continue
-            coords = pd.read_csv(f"{raw_data_path}/{source}/{sample}/{rep}/2Dcoords.csv")
-            coords = coords[["time", "type", "x"]]
-            counts = coords.groupby(["time", "type"]).count().reset_index()
-            counts["sample"] = sample
-            df = pd.concat([counts, df])
+            runs.append((sample, f"{raw_data_path}/{source}/{sample}/{rep}/2Dcoords.csv"))
+    return runs
+
+
+def main(data_type, source, use_catalog=False):
+    df = pd.DataFrame()
+    for sample, coords_path in get_run_paths(data_type, source, use_catalog):
+        coords = read_coords(coords_path, columns=["time", "type"])
+        counts = count_cell_types(coords)
+        counts = counts.rename({name: t for t, name in CELL_TYPES.items()}, axis=1)
+        counts = counts.melt(
+            id_vars=["time"], value_vars=list(CELL_TYPES), var_name="type", value_name="x"
+        )
+        counts["sample"] = sample
+        df = pd.concat([counts, df])
 
     types = [0, 1]
     colors = [game_colors["Sensitive Wins"], game_colors["Resistant Wins"]]
@@ -54,7 +72,9 @@ def main(data_type, source):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 3:
-        main(*sys.argv[1:])
-    else:
-        print("Please see the module docstring for usage instructions.")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("data_type", type=str)
+    parser.add_argument("source", type=str)
+    parser.add_argument("-catalog", "--catalog", action="store_true")
+    args = parser.parse_args()
+    main(args.data_type, args.source, args.catalog)
@@ -5,6 +5,7 @@ import pandas as pd
 import seaborn as sns
 
 from data_processing.in_vitro.game_analysis_utils import calculate_growth_rates
+from data_processing.processed_samples import load_processed
 from spatial_egt.common import game_colors, get_data_path
 
 cell_colors = [game_colors["Sensitive Wins"], game_colors["Resistant Wins"]]
@@ -29,7 +30,7 @@ def plot_spatial(df, save_loc, exp_name):
                 sample_id = f"{plate_id}_{well}"
                 file_name = f"{exp_name} {sample_id}.csv"
                 try:
-                    df_spatial = pd.read_csv(f"{processed_data_path}/{file_name}")
+                    df_spatial = load_processed(f"{processed_data_path}/{file_name}")
                 except Exception:
                     continue
                 df_spatial["color"] = df_spatial["type"].map(
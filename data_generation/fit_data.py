@@ -5,12 +5,12 @@ fitting interaction and reproduction radii
 """
 
 import argparse
-import os
 import random
 
 import numpy as np
 import pandas as pd
 
+from data_processing.processed_samples import list_processed, load_processed_array
 from EGT_HAL.config_utils import write_config, write_run_scripts
 from spatial_egt.common import get_data_path
 
@@ -20,10 +20,10 @@ def get_grid_size(data_dir):
     max_x = 0
     max_y = 0
     processed_data_path = get_data_path(data_dir, "processed", 72)
-    for file_name in os.listdir(processed_data_path):
-        df_sample = pd.read_csv(f"{processed_data_path}/{file_name}")
-        max_x = np.max([max_x, df_sample["x"].max()])
-        max_y = np.max([max_y, df_sample["y"].max()])
+    for sample_path in list_processed(processed_data_path):
+        sample = load_processed_array(sample_path)
+        max_x = np.max([max_x, sample["x"].max()])
+        max_y = np.max([max_y, sample["y"].max()])
     return int(max_x - 1), int(max_y - 1)
 
 
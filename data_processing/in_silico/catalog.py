@@ -0,0 +1,288 @@
+"""Index EGT_HAL configs and replicate runs in an SQLite catalog
+
+The catalog holds the parameters of every config and the path of every
+replicate coordinate file of a data type, so scripts can query the subset
+they need (by source, game, radii) instead of walking the raw directories
+and parsing each config JSON. Rebuilding only reparses configs that changed.
+
+Expected usage:
+python3 -m data_processing.in_silico.catalog -dir data_type (-workers workers) (-rebuild)
+
+Where:
+data_type: the name of the directory in data/ containing the raw/ data
+workers: optional, the number of processes to use
+rebuild: optional, reindex every config rather than only the changed ones
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+from data_processing.in_silico.dataset import (
+    ProcessingReport,
+    WorkItem,
+    iter_configs,
+    iter_work_items,
+    run_work_items,
+)
+from spatial_egt.common import calculate_game, get_data_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS configs (
+    config_id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    sample TEXT NOT NULL,
+    sample_id TEXT NOT NULL,
+    radii TEXT,
+    game TEXT,
+    a REAL,
+    b REAL,
+    c REAL,
+    d REAL,
+    num_cells INTEGER,
+    proportion_resistant REAL,
+    x INTEGER,
+    y INTEGER,
+    grid_expansion INTEGER,
+    interaction_radius INTEGER,
+    reproduction_radius INTEGER,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER,
+    config TEXT,
+    UNIQUE (source, sample)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    config_id INTEGER NOT NULL REFERENCES configs (config_id) ON DELETE CASCADE,
+    replicate TEXT NOT NULL,
+    seed INTEGER,
+    path TEXT NOT NULL,
+    UNIQUE (config_id, replicate)
+);
+CREATE INDEX IF NOT EXISTS configs_source ON configs (source, sample_id);
+CREATE INDEX IF NOT EXISTS configs_game ON configs (game);
+CREATE INDEX IF NOT EXISTS configs_radii ON configs (radii);
+"""
+
+CONFIG_COLUMNS = [
+    "source",
+    "sample",
+    "sample_id",
+    "radii",
+    "game",
+    "a",
+    "b",
+    "c",
+    "d",
+    "num_cells",
+    "proportion_resistant",
+    "x",
+    "y",
+    "grid_expansion",
+    "interaction_radius",
+    "reproduction_radius",
+    "path",
+    "mtime_ns",
+    "config",
+]
+
+
+def get_catalog_path(data_type):
+    """Get the path of the catalog of a data type"""
+    return f"{get_data_path(data_type, '.')}/catalog.sqlite"
+
+
+def has_catalog(data_type):
+    """Check if the catalog of a data type has been built"""
+    return os.path.isfile(get_catalog_path(data_type))
+
+
+def connect(data_type):
+    """Open the catalog of a data type, creating its tables if needed"""
+    conn = sqlite3.connect(get_catalog_path(data_type))
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def parse_config(item):
+    """Get the catalog row of a single EGT_HAL config
+
+    The sample name of fitted configs is "{sample_id}-{radii}",
+    where radii is "{grid_expansion}_{interaction}_{reproduction}".
+
+    :param item: the work item of the config, with the config JSON as its path
+    :type item: WorkItem
+    :return: the values of CONFIG_COLUMNS
+    :rtype: dict
+    """
+    with open(item.path, encoding="UTF-8") as f:
+        config_text = f.read()
+    config = json.loads(config_text)
+    sample_id, _, radii = item.config.partition("-")
+    return {
+        "source": item.experiment,
+        "sample": item.config,
+        "sample_id": sample_id,
+        "radii": radii or None,
+        "game": calculate_game(config["A"], config["B"], config["C"], config["D"]),
+        "a": config["A"],
+        "b": config["B"],
+        "c": config["C"],
+        "d": config["D"],
+        "num_cells": config["numCells"],
+        "proportion_resistant": config["proportionResistant"],
+        "x": config["x"],
+        "y": config["y"],
+        "grid_expansion": config.get("grid_expansion", 1),
+        "interaction_radius": config.get("interactionRadius"),
+        "reproduction_radius": config.get("reproductionRadius"),
+        "path": item.path,
+        "mtime_ns": os.stat(item.path).st_mtime_ns,
+        "config": config_text,
+    }
+
+
+def build_catalog(data_type, workers=1, rebuild=False):
+    """Index the configs and replicate runs of a data type
+
+    :param data_type: the name of the directory in data/ containing the raw/ data
+    :type data_type: str
+    :param workers: the number of processes to parse configs with
+    :type workers: int
+    :param rebuild: whether to reparse configs that have not changed
+    :type rebuild: bool
+    :return: the report of the run
+    :rtype: ProcessingReport
+    """
+    raw_data_path = get_data_path(data_type, "raw")
+    report = ProcessingReport()
+    conn = connect(data_type)
+    indexed = {
+        path: mtime_ns for path, mtime_ns in conn.execute("SELECT path, mtime_ns FROM configs")
+    }
+    items = []
+    found = set()
+    for item in iter_configs(raw_data_path):
+        found.add(item.path)
+        if not os.path.isfile(item.path):
+            report.add_missing(item.path)
+        elif rebuild or indexed.get(item.path) != os.stat(item.path).st_mtime_ns:
+            items.append(item)
+        else:
+            report.skipped += 1
+
+    placeholders = ", ".join("?" for _ in CONFIG_COLUMNS)
+    upsert = (
+        f"INSERT INTO configs ({', '.join(CONFIG_COLUMNS)}) VALUES ({placeholders}) "
+        f"ON CONFLICT (source, sample) DO UPDATE SET "
+        + ", ".join(f"{col} = excluded.{col}" for col in CONFIG_COLUMNS)
+    )
+    with conn:
+        for _, row in run_work_items(parse_config, items, workers, report):
+            conn.execute(upsert, [row[col] for col in CONFIG_COLUMNS])
+        removed = [(path,) for path in indexed if path not in found]
+        conn.executemany("DELETE FROM configs WHERE path = ?", removed)
+
+        config_ids = dict(conn.execute("SELECT source || '/' || sample, config_id FROM configs"))
+        conn.execute("DELETE FROM runs")
+        runs = []
+        for item in iter_work_items(raw_data_path, report=report):
+            config_id = config_ids.get(f"{item.experiment}/{item.config}")
+            if config_id is None:
+                continue
+            seed = int(item.replicate) if item.replicate.isdigit() else None
+            runs.append((config_id, item.replicate, seed, item.path))
+        conn.executemany(
+            "INSERT OR REPLACE INTO runs (config_id, replicate, seed, path) VALUES (?, ?, ?, ?)",
+            runs,
+        )
+    conn.close()
+    return report
+
+
+def _where(filters):
+    """Build a WHERE clause from column filters, where a list matches any of its values"""
+    clauses = []
+    values = []
+    for column, value in filters.items():
+        if column not in CONFIG_COLUMNS:
+            raise ValueError(f"Cannot filter on {column}, must be one of {CONFIG_COLUMNS}")
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = list(value)
+            clauses.append(f"c.{column} IN ({', '.join('?' for _ in value)})")
+            values.extend(value)
+        else:
+            clauses.append(f"c.{column} = ?")
+            values.append(value)
+    if not clauses:
+        return "", values
+    return " WHERE " + " AND ".join(clauses), values
+
+
+def query_configs(data_type, **filters):
+    """Get the configs of a data type matching the filters
+
+    :param data_type: the name of the directory in data/ with a catalog
+    :type data_type: str
+    :param filters: column values to match, e.g. source="HAL", game=["Bistability"]
+    :type filters: dict[str, Any]
+    :return: one row per config, without the raw config JSON
+    :rtype: Pandas DataFrame
+    """
+    columns = ", ".join(f"c.{col}" for col in CONFIG_COLUMNS if col != "config")
+    where, values = _where(filters)
+    conn = connect(data_type)
+    df = pd.read_sql_query(
+        f"SELECT {columns} FROM configs c{where} ORDER BY c.source, c.sample", conn, params=values
+    )
+    conn.close()
+    return df
+
+
+def query_runs(data_type, **filters):
+    """Get the replicate runs of the configs of a data type matching the filters
+
+    :param data_type: the name of the directory in data/ with a catalog
+    :type data_type: str
+    :param filters: config column values to match, as in query_configs
+    :type filters: dict[str, Any]
+    :return: one row per run, with its source, sample, radii, replicate, seed, and path
+    :rtype: Pandas DataFrame
+    """
+    where, values = _where(filters)
+    conn = connect(data_type)
+    df = pd.read_sql_query(
+        "SELECT c.source, c.sample, c.sample_id, c.radii, r.replicate, r.seed, r.path "
+        f"FROM runs r JOIN configs c USING (config_id){where} "
+        "ORDER BY c.source, c.sample, r.replicate",
+        conn,
+        params=values,
+    )
+    conn.close()
+    return df
+
+
+def iter_catalog_work_items(data_type, **filters):
+    """Yield a work item for each replicate run in the catalog, as iter_work_items does"""
+    for row in query_runs(data_type, **filters).itertuples(index=False):
+        yield WorkItem(row.source, row.sample, row.replicate, row.path)
+
+
+def main():
+    """Index the configs and runs of a data type in its catalog"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-dir", "--data_type", type=str, default="in_silico")
+    parser.add_argument("-workers", "--workers", type=int, default=1)
+    parser.add_argument("-rebuild", "--rebuild", action="store_true")
+    args = parser.parse_args()
+    report = build_catalog(args.data_type, args.workers, args.rebuild)
+    report.print_summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Walk and process EGT_HAL raw data directories
+
+The raw data of an ABM data type is laid out as
+raw/{experiment}/{config}/{config}.json for each config and
+raw/{experiment}/{config}/{replicate}/2Dcoords.csv for each replicate.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+import json
+import os
+import traceback
+
+from data_processing.in_silico.trajectories import get_parquet_path
+
+WorkItem = namedtuple("WorkItem", ["experiment", "config", "replicate", "path"])
+ConfigWorkItem = namedtuple("ConfigWorkItem", ["experiment", "config", "items", "path"])
+
+
+class ProcessingReport:
+    """Collect missing files and failures of a processing run to report at the end"""
+
+    def __init__(self):
+        self.processed = 0
+        self.skipped = 0
+        self.missing = []
+        self.failures = []
+
+    def add_missing(self, path, reason="Data not found"):
+        self.missing.append((path, reason))
+
+    def add_failure(self, item, error):
+        self.failures.append((item, error))
+
+    def print_summary(self):
+        print(f"Processed {self.processed} items")
+        if self.skipped:
+            print(f"Skipped {self.skipped} up to date items")
+        if self.missing:
+            print(f"{len(self.missing)} missing:")
+            for path, reason in self.missing:
+                print(f"\t{reason}: {path}")
+        if self.failures:
+            print(f"{len(self.failures)} failed:")
+            for item, error in self.failures:
+                print(f"\t{item.path}\n{error}")
+
+
+def _scan_dirs(path):
+    """Get the name and path of each subdirectory, in sorted order"""
+    with os.scandir(path) as entries:
+        dirs = [(entry.name, entry.path) for entry in entries if entry.is_dir()]
+    return sorted(dirs)
+
+
+def iter_configs(raw_data_path):
+    """Yield a work item for each config, with the config JSON as its path
+
+    :param raw_data_path: the path to the raw data directory
+    :type raw_data_path: str
+    :return: work items with replicate set to None
+    :rtype: Generator[WorkItem]
+    """
+    for experiment, experiment_path in _scan_dirs(raw_data_path):
+        for config, config_path in _scan_dirs(experiment_path):
+            yield WorkItem(experiment, config, None, f"{config_path}/{config}.json")
+
+
+def iter_work_items(raw_data_path, suffix="coords.csv", report=None):
+    """Yield a work item for each non-empty model file in the raw data directory
+
+    :param raw_data_path: the path to the raw data directory
+    :type raw_data_path: str
+    :param suffix: the end of the model file names to yield
+    :type suffix: str
+    :param report: the report to record replicates without model files in
+    :type report: ProcessingReport, optional
+    :return: work items of each model file
+    :rtype: Generator[WorkItem]
+    """
+    for experiment, config, _, config_file in iter_configs(raw_data_path):
+        for replicate, replicate_path in _scan_dirs(os.path.dirname(config_file)):
+            found = False
+            with os.scandir(replicate_path) as entries:
+                model_files = sorted(
+                    entry.path for entry in entries if entry.is_file() and entry.name.endswith(suffix)
+                )
+            for model_path in model_files:
+                if os.path.getsize(model_path) == 0:
+                    continue
+                found = True
+                yield WorkItem(experiment, config, replicate, model_path)
+            if not found and report is not None:
+                report.add_missing(f"{replicate_path}/*{suffix}")
+
+
+def group_by_config(items):
+    """Group the work items of each config's replicates into one work item
+
+    Outputs named by config are shared by all of its replicates, so grouping
+    them makes sure each output is written by a single process.
+
+    :param items: the work items of model files
+    :type items: Iterable[WorkItem]
+    :return: a work item per config, in the order of the configs, with the work items
+        of its replicates sorted by replicate and the config directory as its path
+    :rtype: list[ConfigWorkItem]
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault((item.experiment, item.config), []).append(item)
+    return [
+        ConfigWorkItem(
+            experiment,
+            config,
+            sorted(config_items, key=lambda item: (item.replicate, item.path)),
+            os.path.dirname(os.path.dirname(config_items[0].path)),
+        )
+        for (experiment, config), config_items in groups.items()
+    ]
+
+
+@lru_cache(maxsize=None)
+def _load_config(config_file):
+    with open(config_file, encoding="UTF-8") as f:
+        return json.load(f)
+
+
+def load_config(item):
+    """Get the config of a work item, parsing each config JSON at most once per process"""
+    if item.replicate is None:
+        config_file = item.path
+    else:
+        config_file = f"{os.path.dirname(os.path.dirname(item.path))}/{item.config}.json"
+    return _load_config(config_file)
+
+
+def get_item_inputs(item):
+    """Get the files the processing of a model file work item depends on"""
+    config_file = f"{os.path.dirname(os.path.dirname(item.path))}/{item.config}.json"
+    return [item.path, get_parquet_path(item.path), config_file]
+
+
+def _run_item(func, item):
+    try:
+        return True, func(item)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+def run_work_items(func, items, workers=1, report=None, on_result=None):
+    """Apply a function to each work item, across a pool of processes if requested
+
+    Exceptions raised by the function are recorded in the report
+    instead of stopping the run.
+
+    :param func: picklable function that takes a work item
+    :type func: Callable
+    :param items: the work items to process
+    :type items: Iterable[WorkItem]
+    :param workers: the number of processes to use, defaults to 1
+    :type workers: int, optional
+    :param report: the report to record failures in, defaults to a new report
+    :type report: ProcessingReport, optional
+    :param on_result: called in this process with each work item and result
+        as soon as it succeeds, e.g. to record progress
+    :type on_result: Callable, optional
+    :return: the work item and result of each successful call, in the order of the items
+    :rtype: list[tuple[WorkItem, Any]]
+    """
+    report = ProcessingReport() if report is None else report
+    results = []
+
+    def collect(index, item, succeeded, result):
+        if succeeded:
+            report.processed += 1
+            results.append((index, item, result))
+            if on_result is not None:
+                on_result(item, result)
+        else:
+            report.add_failure(item, result)
+
+    if workers <= 1:
+        for index, item in enumerate(items):
+            collect(index, item, *_run_item(func, item))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_run_item, func, item): (index, item)
+                for index, item in enumerate(items)
+            }
+            for future in as_completed(futures):
+                collect(*futures[future], *future.result())
+    return [(item, result) for _, item, result in sorted(results, key=lambda x: x[0])]
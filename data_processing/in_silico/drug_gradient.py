@@ -1,89 +1,167 @@
 """Split ABM grid into multiple samples
 
 Expected usage:
-python3 -m data_processing.in_silico.drug_gradient data_type grid_size time
+python3 -m data_processing.in_silico.drug_gradient data_type grid_size time (workers) (max_memory)
 
 Where:
 data_type: the name of the directory in data/ containing the raw/ data
-grid_size: the resulting size the split grids should be
+grid_size: the resulting size the split grids should be,
+    either a single length (50) or a width and height (50x100).
+    Several sizes can be given separated by commas (50,100x50),
+    in which case each is saved to data/{data_type}_split{grid_size}
 time: timepoint
+workers: optional, the number of processes to use
+max_memory: optional, the memory ceiling in MB for reading each raw file
 """
 
+from functools import partial
 import json
 import os
 import sys
 
-import pandas as pd
-
+from data_processing.in_silico.dataset import (
+    ProcessingReport,
+    iter_work_items,
+    load_config,
+    run_work_items,
+)
+from data_processing.in_silico.trajectories import read_coords
 from spatial_egt.common import get_data_path
 
 
-def save_splits(data_path, data_dir, rep, config, df, grid_size):
-    config["x"] = grid_size
-    config["y"] = grid_size
-    for split in df["split"].unique():
-        df_split = df[df["split"] == split]
-        gradient = split[0]
-        if gradient == "0":
-            gradient = ""
+def parse_grid_size(grid_size):
+    """Get the tile width and height from a grid size string such as 50 or 50x100"""
+    sizes = [int(size) for size in str(grid_size).lower().split("x")]
+    if len(sizes) == 1:
+        return sizes[0], sizes[0]
+    return sizes[0], sizes[1]
+
+
+def get_num_bands(config):
+    """Get the number of drug gradient bands, one for each payoff matrix (A, A1, A2, ...)"""
+    num_bands = 1
+    while f"A{num_bands}" in config:
+        num_bands += 1
+    return num_bands
+
+
+def get_band(i, tile_x, grid_x, num_bands):
+    """Get the drug gradient band of the i-th column of tiles
+
+    The bands split the grid into num_bands equal widths along x.
+
+    :raises ValueError: if the tile straddles two bands
+    """
+    band_x = grid_x // num_bands
+    band = (i * tile_x) // band_x
+    if ((i + 1) * tile_x - 1) // band_x != band:
+        raise ValueError(
+            f"Tiles of width {tile_x} straddle the drug gradient bands of width {band_x}."
+        )
+    return band
+
+
+def save_splits(data_path, data_dir, rep, config, df, tile_x, tile_y):
+    # Check every tile is within one band before saving any
+    num_bands = get_num_bands(config)
+    bands = {i: get_band(i, tile_x, config["x"], num_bands) for i in df["split_x"].unique()}
+    config = config.copy()
+    config["x"] = tile_x
+    config["y"] = tile_y
+    for (i, j), df_split in df.groupby(["split_x", "split_y"]):
+        split = f"{i}_{j}"
+        gradient = "" if bands[i] == 0 else bands[i]
         split_config = config.copy()
         split_config["A"] = split_config[f"A{gradient}"]
         split_config["B"] = split_config[f"B{gradient}"]
         split_config["C"] = split_config[f"C{gradient}"]
         split_config["D"] = split_config[f"D{gradient}"]
-        os.makedirs(f"{data_path}/{data_dir}/{rep}_{split}/{rep}")
+        os.makedirs(f"{data_path}/{data_dir}/{rep}_{split}/{rep}", exist_ok=True)
         with open(f"{data_path}/{data_dir}/{rep}_{split}/{rep}_{split}.json", "w") as f:
             json.dump(split_config, f)
+        df_split = df_split.drop(["split_x", "split_y"], axis=1)
         df_split.to_csv(f"{data_path}/{data_dir}/{rep}_{split}/{rep}/2Dcoords.csv", index=False)
 
 
-def assign_splits(row, num_splits, grid_size):
-    for i in range(num_splits):
-        for j in range(num_splits):
-            x_in_bounds = (i*grid_size <= row["x"] < (i+1)*grid_size)
-            y_in_bounds = (j*grid_size <= row["y"] < (j+1)*grid_size)
-            if x_in_bounds and y_in_bounds:
-                row["split"] = f"{i}_{j}"
-                row["x"] = row["x"] - i*grid_size
-                row["y"] = row["y"] - j*grid_size
-                return row
-    print(row)
-    raise ValueError("Coordinates unable to be properly split.")
+def assign_splits(df, grid_x, grid_y, tile_x, tile_y):
+    """Assign each cell to a tile and shift its coordinates to be relative to the tile
+
+    Only whole tiles are kept, so cells in the remainder of a grid whose
+    size is not a multiple of the tile size are dropped, and are counted by
+    split_sample to be reported.
+
+    :param df: the coordinates of a single sample at a single time
+    :type df: Pandas DataFrame
+    :param grid_x: the width of the full grid
+    :type grid_x: int
+    :param grid_y: the height of the full grid
+    :type grid_y: int
+    :param tile_x: the width of each tile
+    :type tile_x: int
+    :param tile_y: the height of each tile
+    :type tile_y: int
+    :return: the coordinates with split, split_x and split_y columns
+    :rtype: Pandas DataFrame
+    """
+    df = df.astype({"x": int, "y": int})
+    split_x = df["x"] // tile_x
+    split_y = df["y"] // tile_y
+    in_tile = (split_x >= 0) & (split_x < grid_x // tile_x)
+    in_tile &= (split_y >= 0) & (split_y < grid_y // tile_y)
+    df = df[in_tile].copy()
+    split_x = split_x[in_tile]
+    split_y = split_y[in_tile]
+    df["x"] = df["x"] - split_x * tile_x
+    df["y"] = df["y"] - split_y * tile_y
+    df["split"] = split_x.astype(str) + "_" + split_y.astype(str)
+    df["split_x"] = split_x
+    df["split_y"] = split_y
+    return df
+
+
+def split_sample(item, time, new_data_paths, max_memory=None):
+    """Split a single raw coordinate file at the given time into tiles of each size
+
+    :return: the number of cells outside of the whole tiles of each tile size
+    :rtype: dict[tuple[int, int], int]
+    """
+    config = load_config(item)
+    df = read_coords(item.path, times=[time], max_memory=max_memory)
+    num_dropped = {}
+    for (tile_x, tile_y), new_data_path in new_data_paths.items():
+        df_split = assign_splits(df, config["x"], config["y"], tile_x, tile_y)
+        save_splits(new_data_path, item.config, item.replicate, config, df_split, tile_x, tile_y)
+        num_dropped[(tile_x, tile_y)] = len(df) - len(df_split)
+    return num_dropped
 
 
-def main(data_type, grid_size, time):
+def main(data_type, grid_size, time, workers=1, max_memory=None):
     """Extract and compile game data from each EGT_HAL config"""
     curr_data_path = get_data_path(data_type, "raw")
-    new_data_path = get_data_path(data_type+"_split", "raw")
-    for exp_name in os.listdir(curr_data_path):
-        exp_path = f"{curr_data_path}/{exp_name}"
-        if os.path.isfile(exp_path):
-            continue
-        for data_dir in os.listdir(exp_path):
-            data_path = f"{exp_path}/{data_dir}"
-            if os.path.isfile(data_path):
-                continue
-            config = json.load(open(f"{data_path}/{data_dir}.json", encoding="UTF-8"))
-            num_splits = config["x"] // grid_size
-            for rep_dir in os.listdir(data_path):
-                rep_path = f"{data_path}/{rep_dir}"
-                if os.path.isfile(rep_path):
-                    continue
-                for model_file in os.listdir(rep_path):
-                    model_path = f"{rep_path}/{model_file}"
-                    if not model_file.endswith("coords.csv"):
-                        continue
-                    if not os.path.exists(model_path) or os.path.getsize(model_path) == 0:
-                        print(f"Data not found in {model_path}")
-                        continue
-                    df = pd.read_csv(model_path)
-                    df = df[df["time"] == time]
-                    df = df.apply(assign_splits, args=(num_splits, grid_size), axis=1)
-                    save_splits(new_data_path, data_dir, rep_dir, config, df, grid_size)
+    grid_sizes = str(grid_size).split(",")
+    new_data_paths = {}
+    for size in grid_sizes:
+        split_name = "_split" if len(grid_sizes) == 1 else f"_split{size}"
+        new_data_paths[parse_grid_size(size)] = get_data_path(data_type+split_name, "raw")
+    report = ProcessingReport()
+    items = iter_work_items(curr_data_path, report=report)
+    func = partial(
+        split_sample, time=time, new_data_paths=new_data_paths, max_memory=max_memory
+    )
+    for item, num_dropped in run_work_items(func, items, workers, report):
+        for (tile_x, tile_y), num_cells in num_dropped.items():
+            if num_cells > 0:
+                reason = f"{num_cells} cells outside of the {tile_x}x{tile_y} tiles dropped"
+                report.add_missing(item.path, reason)
+    report.print_summary()
 
 
 if __name__ == "__main__":
     if len(sys.argv) == 4:
-        main(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+        main(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+    elif len(sys.argv) == 5:
+        main(sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    elif len(sys.argv) == 6:
+        main(sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), float(sys.argv[5]))
     else:
         print("Please see the module docstring for usage instructions.")
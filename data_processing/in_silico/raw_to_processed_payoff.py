@@ -1,44 +1,85 @@
 import argparse
-import json
-import os
 
 import pandas as pd
 
+from data_processing.in_silico.catalog import query_configs
+from data_processing.in_silico.dataset import (
+    ProcessingReport,
+    iter_configs,
+    load_config,
+    run_work_items,
+)
+from data_processing.manifest import get_manifest
 from spatial_egt.common import calculate_game, get_data_path
 
 
+def get_config_row(item):
+    """Extract the game data of a single EGT_HAL config"""
+    df_row = {}
+    config = load_config(item)
+    df_row["source"] = item.experiment
+    df_row["sample"] = item.config
+    df_row["initial_density"] = config["numCells"] / (config["x"] * config["y"])
+    df_row["initial_fs"] = 1 - config["proportionResistant"]
+    df_row["a"] = config["A"]
+    df_row["b"] = config["B"]
+    df_row["c"] = config["C"]
+    df_row["d"] = config["D"]
+    df_row["game"] = calculate_game(config["A"], config["B"], config["C"], config["D"])
+    return df_row
+
+
+def get_catalog_rows(data_type):
+    """Get the game data of each config from the catalog instead of the config JSONs"""
+    df = query_configs(data_type)
+    df["initial_density"] = df["num_cells"] / (df["x"] * df["y"])
+    df["initial_fs"] = 1 - df["proportion_resistant"]
+    columns = ["source", "sample", "initial_density", "initial_fs", "a", "b", "c", "d", "game"]
+    return df[columns].to_dict("records")
+
+
 def main():
     """Extract and compile game data from each EGT_HAL config"""
     parser = argparse.ArgumentParser()
     parser.add_argument("-dir", "--data_type", type=str, default="in_silico")
+    parser.add_argument("-workers", "--workers", type=int, default=1)
+    parser.add_argument("-catalog", "--catalog", action="store_true")
+    parser.add_argument("-hash", "--hash", action="store_true")
+    parser.add_argument("-force", "--force", action="store_true")
     args = parser.parse_args()
 
-    raw_data_path = get_data_path(args.data_type, "raw")
-    df_entries = []
-    for experiment_name in os.listdir(raw_data_path):
-        experiment_path = f"{raw_data_path}/{experiment_name}"
-        if os.path.isfile(experiment_path):
-            continue
-        for data_dir in os.listdir(experiment_path):
-            data_path = f"{experiment_path}/{data_dir}"
-            if os.path.isfile(data_path):
-                continue
-            df_row = {}
-            config = json.load(open(f"{data_path}/{data_dir}.json", encoding="UTF-8"))
-            df_row["source"] = experiment_name
-            df_row["sample"] = data_dir
-            df_row["initial_density"] = config["numCells"] / (config["x"] * config["y"])
-            df_row["initial_fs"] = 1 - config["proportionResistant"]
-            df_row["a"] = config["A"]
-            df_row["b"] = config["B"]
-            df_row["c"] = config["C"]
-            df_row["d"] = config["D"]
-            df_row["game"] = calculate_game(config["A"], config["B"], config["C"], config["D"])
-            df_entries.append(df_row)
     data_path = get_data_path(args.data_type, ".")
+    if args.catalog:
+        df = pd.DataFrame(data=get_catalog_rows(args.data_type))
+        df = df[df["game"] != "Unknown"]
+        df.to_csv(f"{data_path}/labels.csv", index=False)
+        return
+
+    raw_data_path = get_data_path(args.data_type, "raw")
+    manifest = get_manifest(args.data_type, "raw_to_processed_payoff", args.hash, args.force)
+    report = ProcessingReport()
+    items = list(iter_configs(raw_data_path))
+    df_rows = {}
+    stale_items = []
+    for item in items:
+        entry = manifest.get(item.path, [item.path], {})
+        if entry is None:
+            stale_items.append(item)
+        else:
+            df_rows[item.path] = entry["result"]
+            report.skipped += 1
+
+    def record(item, df_row):
+        manifest.record(item.path, [item.path], {}, result=df_row)
+
+    results = run_work_items(get_config_row, stale_items, args.workers, report, on_result=record)
+    df_rows.update({item.path: df_row for item, df_row in results})
+    df_entries = [df_rows[item.path] for item in items if item.path in df_rows]
+    manifest.compact()
     df = pd.DataFrame(data=df_entries)
     df = df[df["game"] != "Unknown"]
     df.to_csv(f"{data_path}/labels.csv", index=False)
+    report.print_summary()
 
 
 if __name__ == "__main__":
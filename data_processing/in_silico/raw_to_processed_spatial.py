@@ -1,52 +1,130 @@
 import argparse
-import json
-import os
+from functools import partial
 
 import pandas as pd
 
+from data_processing.in_silico.catalog import iter_catalog_work_items
+from data_processing.in_silico.dataset import (
+    ProcessingReport,
+    get_item_inputs,
+    group_by_config,
+    iter_work_items,
+    load_config,
+    run_work_items,
+)
+from data_processing.in_silico.trajectories import read_coords
+from data_processing.manifest import get_manifest
+from data_processing.processed_samples import FILE_FORMATS, get_processed_paths, save_processed
 from spatial_egt.common import get_data_path
 
 
+def save_timepoints(df, grid_expansion, processed_data_paths, file_name, file_format="csv"):
+    """Save the coordinates at each requested time from a single read of the raw file
+
+    :param df: the raw coordinates of a sample across all written time steps
+    :type df: Pandas DataFrame
+    :param grid_expansion: how much to scale the coordinates by
+    :type grid_expansion: int
+    :param processed_data_paths: the processed data path of each time,
+        where a time of None means the last time step in the file
+    :type processed_data_paths: dict[int | None, str]
+    :param file_name: the name of the processed file
+    :type file_name: str
+    :param file_format: whether to save as csv, npy, or both
+    :type file_format: str
+    :return: the requested times that were not in the raw file
+    :rtype: list[int]
+    """
+    cell_type_map = {0: "sensitive", 1: "resistant"}
+    df_times = df.groupby("time")
+    missing_times = []
+    for time, processed_data_path in processed_data_paths.items():
+        if time is None:
+            time = df["time"].max()
+        if time not in df_times.groups:
+            missing_times.append(time)
+            continue
+        df_time = df_times.get_group(time)
+        df_time = pd.DataFrame(
+            {
+                "type": df_time["type"].map(cell_type_map),
+                "x": df_time["x"].astype(int) * grid_expansion,
+                "y": df_time["y"].astype(int) * grid_expansion,
+            }
+        )
+        save_processed(df_time, f"{processed_data_path}/{file_name}", file_format)
+    return missing_times
+
+
+def process_sample(item, processed_data_paths, max_memory=None, file_format="csv"):
+    """Save the requested times of a single raw coordinate file"""
+    times = list(processed_data_paths)
+    df = read_coords(item.path, times, ["time", "type", "x", "y"], max_memory)
+    grid_expansion = load_config(item).get("grid_expansion", 1)
+    file_name = f"{item.experiment} {item.config}.csv"
+    return save_timepoints(df, grid_expansion, processed_data_paths, file_name, file_format)
+
+
 def main():
-    """Save each raw coordinate file as a processed file"""
+    """Save each raw coordinate file as a processed file at each requested time"""
     parser = argparse.ArgumentParser()
     parser.add_argument("-dir", "--data_type", type=str, default="in_silico")
-    parser.add_argument("-time", "--time", type=int, default=None)
+    parser.add_argument("-time", "--time", type=int, nargs="+", default=None)
+    parser.add_argument("-workers", "--workers", type=int, default=1)
+    parser.add_argument("-mem", "--max_memory", type=float, default=None)
+    parser.add_argument("-format", "--file_format", type=str, default="csv", choices=FILE_FORMATS)
+    parser.add_argument("-catalog", "--catalog", action="store_true")
+    parser.add_argument("-hash", "--hash", action="store_true")
+    parser.add_argument("-force", "--force", action="store_true")
     args = parser.parse_args()
 
     raw_data_path = get_data_path(args.data_type, "raw")
-    processed_data_path = get_data_path(args.data_type, "processed", args.time)
-    cell_type_map = {0: "sensitive", 1: "resistant"}
-    for exp_name in os.listdir(raw_data_path):
-        exp_path = f"{raw_data_path}/{exp_name}"
-        if os.path.isfile(exp_path):
-            continue
-        for data_dir in os.listdir(exp_path):
-            data_path = f"{exp_path}/{data_dir}"
-            if os.path.isfile(data_path):
-                continue
-            for rep_dir in os.listdir(data_path):
-                rep_path = f"{data_path}/{rep_dir}"
-                if os.path.isfile(rep_path):
-                    continue
-                for model_file in os.listdir(rep_path):
-                    model_path = f"{rep_path}/{model_file}"
-                    if not model_file.endswith("coords.csv"):
-                        continue
-                    if not os.path.exists(model_path) or os.path.getsize(model_path) == 0:
-                        print(f"Data not found in {model_path}")
-                        continue
-                    df = pd.read_csv(model_path)
-                    if args.time is None:
-                        df = df[df["time"] == df["time"].max()]
-                    else:
-                        df = df[df["time"] == args.time]
-                    df["type"] = df["type"].map(cell_type_map)
-                    config = json.load(open(f"{data_path}/{data_dir}.json", encoding="UTF-8"))
-                    df["x"] = df["x"] * config.get("grid_expansion", 1)
-                    df["y"] = df["y"] * config.get("grid_expansion", 1)
-                    df = df[["type", "x", "y"]]
-                    df.to_csv(f"{processed_data_path}/{exp_name} {data_dir}.csv", index=False)
+    times = [None] if args.time is None else args.time
+    processed_data_paths = {time: get_data_path(args.data_type, "processed", time) for time in times}
+    manifest = get_manifest(args.data_type, "raw_to_processed_spatial", args.hash, args.force)
+    report = ProcessingReport()
+
+    def get_outputs(item):
+        file_name = f"{item.experiment} {item.config}.csv"
+        return {time: f"{path}/{file_name}" for time, path in processed_data_paths.items()}
+
+    # Entries are keyed on the output, since the replicates of a config share it,
+    # and the inputs are those of the replicate the output is saved from
+    def is_stale(item):
+        inputs = get_item_inputs(item)
+        for time, output in get_outputs(item).items():
+            params = {"file_format": args.file_format, "time": time}
+            if not manifest.is_current(output, inputs, params):
+                return True
+        report.skipped += 1
+        return False
+
+    def record(item, missing_times):
+        inputs = get_item_inputs(item)
+        for time, output in get_outputs(item).items():
+            if time in missing_times:
+                report.add_missing(item.path, f"Time {time} not found")
+            else:
+                params = {"file_format": args.file_format, "time": time}
+                outputs = get_processed_paths(output, args.file_format)
+                manifest.record(output, inputs, params, outputs)
+
+    if args.catalog:
+        items = iter_catalog_work_items(args.data_type)
+    else:
+        items = iter_work_items(raw_data_path, report=report)
+    # Replicates of a config share its processed files, so only the last replicate is saved
+    items = [config_item.items[-1] for config_item in group_by_config(items)]
+    items = filter(is_stale, items)
+    func = partial(
+        process_sample,
+        processed_data_paths=processed_data_paths,
+        max_memory=args.max_memory,
+        file_format=args.file_format,
+    )
+    run_work_items(func, items, args.workers, report, on_result=record)
+    manifest.compact()
+    report.print_summary()
 
 
 if __name__ == "__main__":
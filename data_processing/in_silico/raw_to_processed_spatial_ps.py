@@ -1,90 +1,105 @@
 """Compile EGT_HAL final timestep coordinates into processed csvs
 
 Expected usage:
-python3 -m data_processing.in_silico.raw_to_processed_ps data_type
+python3 -m data_processing.in_silico.raw_to_processed_ps data_type (workers) (max_memory) (file_format)
 
 Where:
 data_type: the name of the directory in data/ containing the raw/ data
+workers: optional, the number of processes to use
+max_memory: optional, the memory ceiling in MB for reading each raw file
+file_format: optional, save processed samples as csv (default), npy, or both
 """
 
+from functools import partial
 import sys
-import os
 import random
 
-import pandas as pd
-
+from data_processing.in_silico.dataset import (
+    ProcessingReport,
+    group_by_config,
+    iter_work_items,
+    run_work_items,
+)
+from data_processing.in_silico.trajectories import count_trajectory, read_coords
+from data_processing.processed_samples import save_processed
 from spatial_egt.common import get_data_path
 
 
-def get_proportion(counts):
-    """Calculate proportion resistant at each time step
+def get_time_in_range(counts, rng=random):
+    """Get a random time step where the proportion resistant is near 0.5
 
-    :param counts: the sensitive and resistant count
-        of a single sample at a single time step
-    :type counts: Pandas Series
-    :return: proportion resistant at the time step
-    :rtype: float
+    :param counts: the cell type counts at each time step, from count_trajectory
+    :type counts: Pandas DataFrame
+    :param rng: the random generator to choose the time step with
+    :type rng: random.Random, optional
+    :return: the time step, or None if no time step is in range
+    :rtype: int | None
     """
-    r_cells = counts.loc[counts["type"] == 1, "x"]
-    s_cells = counts.loc[counts["type"] == 0, "x"]
-    r_cells = r_cells.iloc[0] if not r_cells.empty else 0
-    s_cells = s_cells.iloc[0] if not s_cells.empty else 0
-    return r_cells / (r_cells + s_cells)
-
-
-def get_time_in_range(coords):
-    """Get the proportion resistant at each time step"""
-    # Get the count of each cell type at each time step
-    coords = coords[["time", "type", "x"]]
-    counts = coords.groupby(["time", "type"]).count().reset_index()
-    # Calculate proportion resistant at each time step
-    fr = counts.groupby(["time"])[["type", "x"]]
-    fr = fr.apply(get_proportion).reset_index()
-    fr = fr[(fr[0] > 0.45) & (fr[0] < 0.55)]
+    fr = counts["proportion_resistant"]
+    fr = counts[(fr > 0.45) & (fr < 0.55)]
     if len(fr) == 0:
         return None
-    time = random.sample(fr["time"].tolist(), 1)[0]
+    time = rng.sample(fr["time"].tolist(), 1)[0]
     return time
 
 
-def main(data_type):
+def process_sample(item, processed_data_path, max_memory=None, file_format="csv"):
+    """Save the coordinates of a sample at a time with about half of the cells resistant
+
+    The time is chosen with a random generator seeded by the sample name,
+    so the choice does not depend on the order samples are processed in.
+    """
+    rng = random.Random(f"42 {item.experiment} {item.config}")
+    cell_type_map = {0: "sensitive", 1: "resistant"}
+    time = get_time_in_range(count_trajectory(item.path, max_memory), rng)
+    if time is None:
+        return False
+    df = read_coords(item.path, [time], ["type", "x", "y"], max_memory)
+    df["type"] = df["type"].map(cell_type_map)
+    cols_to_keep = ["type", "x", "y"]
+    df = df[cols_to_keep]
+    save_processed(df, f"{processed_data_path}/{item.experiment} {item.config}.csv", file_format)
+    return True
+
+
+def process_config(config_item, processed_data_path, max_memory=None, file_format="csv"):
+    """Save the last replicate of a config with a time in range, as the processed file of the config
+
+    :return: whether a replicate was saved
+    :rtype: bool
+    """
+    for item in reversed(config_item.items):
+        if process_sample(item, processed_data_path, max_memory, file_format):
+            return True
+    return False
+
+
+def main(data_type, workers=1, max_memory=None, file_format="csv"):
     """Save each raw coordinate file as a processed file"""
-    random.seed(42)
     raw_data_path = get_data_path(data_type, "raw")
     processed_data_path = get_data_path(data_type, "processed", 50)
-    cell_type_map = {0: "sensitive", 1: "resistant"}
-    for exp_name in os.listdir(raw_data_path):
-        exp_path = f"{raw_data_path}/{exp_name}"
-        if os.path.isfile(exp_path):
-            continue
-        for data_dir in os.listdir(exp_path):
-            data_path = f"{exp_path}/{data_dir}"
-            if os.path.isfile(data_path):
-                continue
-            for rep_dir in os.listdir(data_path):
-                rep_path = f"{data_path}/{rep_dir}"
-                if os.path.isfile(rep_path):
-                    continue
-                for model_file in os.listdir(rep_path):
-                    model_path = f"{rep_path}/{model_file}"
-                    if not model_file.endswith("coords.csv"):
-                        continue
-                    if not os.path.exists(model_path) or os.path.getsize(model_path) == 0:
-                        print(f"Data not found in {model_path}")
-                        continue
-                    df = pd.read_csv(model_path)
-                    time = get_time_in_range(df)
-                    if time is None:
-                        continue
-                    df = df[df["time"] == time]
-                    df["type"] = df["type"].map(cell_type_map)
-                    cols_to_keep = ["type", "x", "y"]
-                    df = df[cols_to_keep]
-                    df.to_csv(f"{processed_data_path}/{exp_name} {data_dir}.csv", index=False)
+    report = ProcessingReport()
+    items = group_by_config(iter_work_items(raw_data_path, report=report))
+    func = partial(
+        process_config,
+        processed_data_path=processed_data_path,
+        max_memory=max_memory,
+        file_format=file_format,
+    )
+    for item, saved in run_work_items(func, items, workers, report):
+        if not saved:
+            report.add_missing(item.path, "No time with proportion resistant in range")
+    report.print_summary()
 
 
 if __name__ == "__main__":
     if len(sys.argv) == 2:
         main(sys.argv[1])
+    elif len(sys.argv) == 3:
+        main(sys.argv[1], int(sys.argv[2]))
+    elif len(sys.argv) == 4:
+        main(sys.argv[1], int(sys.argv[2]), float(sys.argv[3]))
+    elif len(sys.argv) == 5:
+        main(sys.argv[1], int(sys.argv[2]), float(sys.argv[3]), sys.argv[4])
     else:
         print("Please see the module docstring for usage instructions.")
@@ -0,0 +1,248 @@
+"""Columnar storage of EGT_HAL coordinate trajectories
+
+Converts each 2Dcoords.csv into a typed 2Dcoords.parquet with one row group
+per written time step, so readers can skip the time steps and columns they
+do not need instead of parsing the whole text file.
+
+Expected usage:
+python3 -m data_processing.in_silico.trajectories -dir data_type
+
+Where:
+data_type: the name of the directory in data/ containing the raw/ data
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from spatial_egt.common import get_data_path
+
+COORD_DTYPES = {"time": "int32", "type": "uint8", "x": "int16", "y": "int16"}
+CELL_TYPES = {0: "sensitive", 1: "resistant"}
+
+
+def get_parquet_path(coords_path):
+    """Get the path of the parquet file belonging to a coordinate csv"""
+    return os.path.splitext(coords_path)[0] + ".parquet"
+
+
+def has_current_parquet(coords_path):
+    """Check if the coordinate csv has a parquet file at least as new as it"""
+    parquet_path = get_parquet_path(coords_path)
+    if not os.path.exists(parquet_path):
+        return False
+    if not os.path.exists(coords_path):
+        return True
+    return os.path.getmtime(parquet_path) >= os.path.getmtime(coords_path)
+
+
+def convert_to_parquet(coords_path):
+    """Save a coordinate csv as parquet, with one row group per time step
+
+    :param coords_path: the path to the 2Dcoords.csv file
+    :type coords_path: str
+    :return: the path to the parquet file
+    :rtype: str
+    """
+    df = pd.read_csv(coords_path)
+    df = df.astype({col: dtype for col, dtype in COORD_DTYPES.items() if col in df.columns})
+    df = df.sort_values("time", kind="stable")
+    parquet_path = get_parquet_path(coords_path)
+    tmp_path = f"{parquet_path}.tmp"
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for _, df_time in df.groupby("time", sort=True):
+            writer.write_table(pa.Table.from_pandas(df_time, schema=schema, preserve_index=False))
+    os.replace(tmp_path, parquet_path)
+    return parquet_path
+
+
+def get_chunk_rows(max_memory, num_columns):
+    """Get how many csv rows to parse at a time to stay within a memory ceiling
+
+    Each parsed value takes 8 bytes, and parsing needs a few times the
+    size of the parsed chunk, so a chunk is kept to a small share of the ceiling.
+
+    :param max_memory: the memory ceiling in MB
+    :type max_memory: float
+    :param num_columns: the number of columns being parsed
+    :type num_columns: int
+    :return: the number of rows per chunk
+    :rtype: int
+    """
+    bytes_per_row = 8 * num_columns
+    return max(int(max_memory * 2**20 / (8 * bytes_per_row)), 1000)
+
+
+def iter_coords(coords_path, columns=None, max_memory=None):
+    """Yield a coordinate trajectory in chunks, each within the memory ceiling
+
+    :param coords_path: the path to the 2Dcoords.csv file
+    :type coords_path: str
+    :param columns: the columns to keep, defaults to all
+    :type columns: list[str], optional
+    :param max_memory: the memory ceiling in MB, defaults to reading in one chunk
+    :type max_memory: float, optional
+    :return: chunks of the coordinates
+    :rtype: Generator[Pandas DataFrame]
+    """
+    if has_current_parquet(coords_path):
+        parquet_file = pq.ParquetFile(get_parquet_path(coords_path))
+        num_columns = len(columns if columns is not None else parquet_file.schema_arrow.names)
+        batch_rows = parquet_file.metadata.num_rows
+        if max_memory is not None:
+            batch_rows = get_chunk_rows(max_memory, num_columns)
+        for batch in parquet_file.iter_batches(batch_size=max(batch_rows, 1), columns=columns):
+            yield batch.to_pandas()
+        return
+    if max_memory is None:
+        yield pd.read_csv(coords_path, usecols=columns)
+        return
+    num_columns = len(columns if columns is not None else pd.read_csv(coords_path, nrows=0).columns)
+    chunk_rows = get_chunk_rows(max_memory, num_columns)
+    dtype = {col: dtype for col, dtype in COORD_DTYPES.items() if columns is None or col in columns}
+    yield from pd.read_csv(coords_path, usecols=columns, dtype=dtype, chunksize=chunk_rows)
+
+
+def read_coords(coords_path, times=None, columns=None, max_memory=None):
+    """Read a coordinate trajectory, keeping only the requested times and columns
+
+    Reads the parquet version of the file when it is up to date,
+    pushing the time filter and column selection into the read.
+    Otherwise falls back to parsing the csv, in chunks if a memory
+    ceiling is given, so only the requested times are ever held in full.
+
+    :param coords_path: the path to the 2Dcoords.csv file
+    :type coords_path: str
+    :param times: the time steps to keep, where None is the last time step,
+        defaults to all time steps
+    :type times: list[int | None], optional
+    :param columns: the columns to keep, defaults to all
+    :type columns: list[str], optional
+    :param max_memory: the memory ceiling for parsing the csv in MB, defaults to None
+    :type max_memory: float, optional
+    :return: the coordinates
+    :rtype: Pandas DataFrame
+    """
+    keep_last = times is not None and None in times
+    if times is not None:
+        times = [int(time) for time in times if time is not None]
+    if has_current_parquet(coords_path):
+        parquet_path = get_parquet_path(coords_path)
+        if keep_last:
+            times.append(get_last_time(parquet_path))
+        filters = None if times is None else [("time", "in", times)]
+        return pd.read_parquet(parquet_path, columns=columns, filters=filters)
+    usecols = columns
+    if columns is not None and times is not None and "time" not in columns:
+        usecols = columns + ["time"]
+    if times is None or max_memory is None:
+        df = pd.read_csv(coords_path, usecols=usecols)
+        if times is not None:
+            df = df[df["time"].isin(times) | (keep_last & (df["time"] == df["time"].max()))]
+    else:
+        chunks = []
+        last_chunks = []
+        last_time = None
+        for chunk in iter_coords(coords_path, usecols, max_memory):
+            chunks.append(chunk[chunk["time"].isin(times)])
+            if keep_last:
+                chunk_last_time = chunk["time"].max()
+                if last_time is None or chunk_last_time > last_time:
+                    last_time = chunk_last_time
+                    last_chunks = []
+                if chunk_last_time == last_time:
+                    last_chunks.append(chunk[chunk["time"] == last_time])
+        if last_time is not None and last_time not in times:
+            chunks.extend(last_chunks)
+        df = pd.concat(chunks, ignore_index=True)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def get_last_time(parquet_path):
+    """Get the last time step of a parquet trajectory from its row group statistics"""
+    metadata = pq.ParquetFile(parquet_path).metadata
+    time_column = metadata.schema.names.index("time")
+    return max(
+        metadata.row_group(i).column(time_column).statistics.max
+        for i in range(metadata.num_row_groups)
+    )
+
+
+def count_cell_types(coords, by=None):
+    """Count the cells of each type at each time step
+
+    All groups are counted at once with a single bincount over
+    (group, time, type), so counting many samples costs one pass.
+
+    :param coords: coordinates with time and type columns
+    :type coords: Pandas DataFrame
+    :param by: additional columns identifying each sample, defaults to None
+    :type by: list[str], optional
+    :return: one row per sample and time step, sorted, with the count of each
+        cell type and the proportion resistant
+    :rtype: Pandas DataFrame
+    """
+    keys = ([] if by is None else list(by)) + ["time"]
+    if len(keys) == 1:
+        codes, uniques = pd.factorize(coords["time"], sort=True)
+        df = pd.DataFrame({"time": uniques})
+    else:
+        codes, uniques = pd.MultiIndex.from_frame(coords[keys]).factorize(sort=True)
+        df = uniques.to_frame(index=False, name=keys)
+    num_types = len(CELL_TYPES)
+    types = coords["type"].to_numpy(dtype=np.intp)
+    counts = np.bincount(codes * num_types + types, minlength=len(df) * num_types)
+    counts = counts.reshape(len(df), num_types)
+    for cell_type, cell_name in CELL_TYPES.items():
+        df[cell_name] = counts[:, cell_type]
+    df["proportion_resistant"] = df["resistant"] / counts.sum(axis=1)
+    return df
+
+
+def count_trajectory(coords_path, max_memory=None):
+    """Count the cells of each type at each time step of a trajectory file, in chunks
+
+    :param coords_path: the path to the 2Dcoords.csv file
+    :type coords_path: str
+    :param max_memory: the memory ceiling in MB, defaults to reading in one chunk
+    :type max_memory: float, optional
+    :return: the counts, as returned by count_cell_types
+    :rtype: Pandas DataFrame
+    """
+    cell_names = list(CELL_TYPES.values())
+    counts = [count_cell_types(chunk) for chunk in iter_coords(coords_path, ["time", "type"], max_memory)]
+    counts = pd.concat(counts).groupby("time", as_index=False)[cell_names].sum()
+    counts["proportion_resistant"] = counts["resistant"] / counts[cell_names].sum(axis=1)
+    return counts
+
+
+def main():
+    """Convert each raw coordinate csv into parquet"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-dir", "--data_type", type=str, default="in_silico")
+    parser.add_argument("-overwrite", "--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    raw_data_path = get_data_path(args.data_type, "raw")
+    for dir_path, _, file_names in os.walk(raw_data_path):
+        for file_name in file_names:
+            if not file_name.endswith("coords.csv"):
+                continue
+            coords_path = f"{dir_path}/{file_name}"
+            if os.path.getsize(coords_path) == 0:
+                print(f"Data not found in {coords_path}")
+                continue
+            if not args.overwrite and has_current_parquet(coords_path):
+                continue
+            convert_to_parquet(coords_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Stand in for CellProfiler to test the plate orchestrator without it
+
+Takes the same headless arguments as CellProfiler and writes an Image.csv of
+random object counts for each image of the well, in the format
+game_analysis_utils.load_cellprofiler_data reads.
+
+Expected usage:
+python3 -m data_processing.in_vitro.cellprofiler_stub -c -r -p pipeline_file -i image_dir
+    -o output_dir -g Metadata_Well=well (-L log_level)
+
+The environment variables CELLPROFILER_STUB_SECONDS (how long each run takes)
+and CELLPROFILER_STUB_FAIL_RATE (the probability that a run fails) simulate
+slow and flaky runs.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+
+def main():
+    """Write random object counts for each image of a well, as CellProfiler would"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", action="store_true")
+    parser.add_argument("-r", action="store_true")
+    parser.add_argument("-p", "--pipeline_file", type=str)
+    parser.add_argument("-i", "--image_dir", type=str, required=True)
+    parser.add_argument("-o", "--output_dir", type=str, required=True)
+    parser.add_argument("-g", "--groups", type=str, required=True)
+    parser.add_argument("-L", "--log_level", type=str, default="50")
+    args = parser.parse_args()
+
+    time.sleep(float(os.environ.get("CELLPROFILER_STUB_SECONDS", 0)))
+    if random.random() < float(os.environ.get("CELLPROFILER_STUB_FAIL_RATE", 0)):
+        print(f"Stub failure for {args.groups}", file=sys.stderr)
+        sys.exit(1)
+
+    well_id = args.groups.split("=", 1)[1]
+    images = sorted(
+        name for name in os.listdir(args.image_dir) if name.split("_")[0] == well_id
+    )
+    rows = [
+        {
+            "FileName_gfp": name,
+            "FileName_texasred": name,
+            "Count_gfp_objects": random.randint(50, 500),
+            "Count_texasred_objects": random.randint(50, 500),
+        }
+        for name in images
+    ]
+    df = pd.DataFrame(
+        rows,
+        columns=["FileName_gfp", "FileName_texasred", "Count_gfp_objects", "Count_texasred_objects"],
+    )
+    df.to_csv(os.path.join(args.output_dir, "Image.csv"), index=False)
+    print(f"Processed {len(images)} images of {well_id}")
+
+
+if __name__ == "__main__":
+    main()
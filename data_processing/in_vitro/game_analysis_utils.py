@@ -11,6 +11,7 @@ import numpy as np
 from scipy import stats
 import matplotlib.pyplot as plt
 import seaborn as sns
+from data_processing.in_vitro.theil_sen import pad_series, theilslopes_batch
 
 # ---------------------------------------------------------------------------------------------------------------
 def run_cellprofiler_on_well(well_id, cellprofiler_path, pipeline_file, dir_to_analyse, output_dir, 
@@ -200,21 +201,66 @@ def estimate_growth_rate(data_df, well_id=None, cell_type=None, growth_rate_wind
         curr_df = curr_df[curr_df["CellType"] == cell_type]
     curr_df = curr_df[curr_df["Time"].between(growth_rate_window[0], growth_rate_window[1])]
 
+    return fit_growth_rate(curr_df["Time"], curr_df["Count"], count_threshold=count_threshold)
+
+# ---------------------------------------------------------------------------------------------------------------
+def fit_growth_rate(times, counts, count_threshold=10):
+    """
+    Fit the (exponential) growth rate of a cell population to its counts over time.
+    times: pandas series of the time of each count
+    counts: pandas series of the cell counts
+    count_threshold: the mean count below which no growth rate is estimated
+    Returns: growth rate, intercept, lower bound of the growth rate, upper bound of the growth rate
+    """
     # Quality control data
-    if curr_df["Count"].min() <= 0: # Check for negative values
-        #print("Zero or negative values detected in the count data. Skipping analysis of %s data for well %s." % (cell_type, well_id))
+    if counts.min() <= 0: # Check for negative values
         return np.nan, np.nan, np.nan, np.nan
-    elif curr_df["Count"].mean() < count_threshold: # Check for low counts
-        #print("Low counts detected in the count data. Skipping analysis of %s data for well %s." % (cell_type, well_id))
+    elif counts.mean() < count_threshold: # Check for low counts
         return np.nan, np.nan, np.nan, np.nan
     
     # Fit a linear model to the log-transformed data. Use the theil-sen estimator
-    x = curr_df["Time"].values - curr_df["Time"].values[0] # Start the time at 0
-    y = np.log(curr_df["Count"].values) # Log-transform
+    x = times.values - times.values[0] # Start the time at 0
+    y = np.log(counts.values) # Log-transform
     slope, intercept, low_slope, high_slope = stats.theilslopes(y, x)
 
     return slope, intercept, low_slope, high_slope
 
+# ---------------------------------------------------------------------------------------------------------------
+def fit_growth_rates(data_df, group_columns, count_threshold=10):
+    """
+    Fit the (exponential) growth rate of every group of cell counts at once, as fit_growth_rate does for one group.
+    data_df: pandas dataframe containing the cell count data in the growth rate window
+    group_columns: the columns identifying each cell population, e.g. plate, well, and cell type
+    count_threshold: the mean count below which no growth rate is estimated
+    Returns: dictionary from each group to its growth rate, intercept, and lower and upper bounds of the growth rate
+    """
+    groups = data_df.groupby(group_columns, sort=False, dropna=False)
+    keys = list(data_df[group_columns].drop_duplicates().itertuples(index=False, name=None))
+    if len(keys) == 0:
+        return {}
+
+    # Pad the counts of each group into the rows of an array, in the order of the data
+    group_ids = groups.ngroup().to_numpy()
+    positions = groups.cumcount().to_numpy()
+    times = np.full((len(keys), positions.max() + 1), np.nan)
+    counts = np.full((len(keys), positions.max() + 1), np.nan)
+    times[group_ids, positions] = data_df["Time"].to_numpy(dtype=float)
+    counts[group_ids, positions] = data_df["Count"].to_numpy(dtype=float)
+
+    # Quality control data
+    passed = ~(groups["Count"].min() <= 0).to_numpy() & ~(groups["Count"].mean() < count_threshold).to_numpy()
+
+    # Fit a linear model to the log-transformed data of the groups that passed. Use the theil-sen estimator
+    with np.errstate(divide="ignore"):
+        y = np.log(counts[passed]) # Log-transform
+    x = times[passed] - times[passed, :1] # Start the time at 0
+    fit = theilslopes_batch(y, x)
+    growth_rates = {key: (np.nan, np.nan, np.nan, np.nan) for key in keys}
+    passed_keys = [key for key, key_passed in zip(keys, passed) if key_passed]
+    for i, key in enumerate(passed_keys):
+        growth_rates[key] = (fit.slope[i], fit.intercept[i], fit.low_slope[i], fit.high_slope[i])
+    return growth_rates
+
 # ---------------------------------------------------------------------------------------------------------------
 def compute_population_fraction(counts_df, fraction_window=None, n_images="all", well_id=None, cell_type_list=None):
     """
@@ -284,16 +330,25 @@ def estimate_game_parameters(growth_rate_df, fraction_col="Fraction_Sensitive",
     
     # Estimate the game parameters
     coeffs_dict = {}
-    for cell_type in growth_rate_df[cell_type_col].unique():
-        tmp_df = growth_rate_df[(growth_rate_df[cell_type_col]==cell_type)  & (growth_rate_df['GrowthRate'].isna()==False)]
+    tmp_df_dict = {
+        cell_type: growth_rate_df[(growth_rate_df[cell_type_col]==cell_type)  & (growth_rate_df['GrowthRate'].isna()==False)]
+        for cell_type in growth_rate_df[cell_type_col].unique()
+    }
+    if method == "theil": # Fit every cell type in one batched call
+        theil_results = theilslopes_batch(
+            y=pad_series([tmp_df[growth_rate_col] for tmp_df in tmp_df_dict.values()]),
+            x=pad_series([tmp_df[fraction_col] for tmp_df in tmp_df_dict.values()]),
+            alpha=ci,
+        )
+    for i, (cell_type, tmp_df) in enumerate(tmp_df_dict.items()):
         if method == "ols":
             ols_result = stats.linregress(x=tmp_df[cell_type_col], y=tmp_df[fraction_col])
             best_fit_func = lambda x: (ols_result.slope * x) + ols_result.intercept
             coeffs_dict[cell_type] = [best_fit_func(0), best_fit_func(1)]
         if method == "theil":
-            theil_result = stats.theilslopes(x=tmp_df[fraction_col], y=tmp_df[growth_rate_col], alpha=ci)
+            theil_result = [result[i] for result in theil_results]
             best_fit_func = lambda x: (theil_result[0] * x) + theil_result[1]
-            coeffs_dict[cell_type] = [best_fit_func(0), best_fit_func(1), theil_result.intercept, theil_result.slope]
+            coeffs_dict[cell_type] = [best_fit_func(0), best_fit_func(1), theil_result[1], theil_result[0]]
     # Transform into pay-off matrix entries. To do so, we need to find out the direction of the x-axis (i.e. whether
     # it's increasing for Type 1 or Type 2 as we go left to right).
     # The growth rate of the "index" population should be nan when their fraction is 0.
@@ -348,42 +403,116 @@ def calculate_payoffs(growth_rate_df, cell_type_list, fraction_col):
     return game_params_df
 
 
-def calculate_growth_rates(counts_df, growth_rate_window, cell_type_list):
+def build_fraction_table(counts_df, cell_type_list):
+    """Turn the counts of every well of every plate to wide format once
+
+    The table answers fraction queries of any time window or number of images
+    for every well at once (query_population_fractions), instead of the counts
+    being pivoted again for each well, cell type, and window.
+
+    :param counts_df: the cell count data, with PlateId, WellId, Time, CellType, and Count columns
+    :type counts_df: Pandas DataFrame
+    :param cell_type_list: the cell types to compute the fraction of
+    :type cell_type_list: list[str]
+    :return: the count of each cell type, TotalCount, and Fraction_{cell type} columns,
+        indexed by PlateId, WellId, and Time, sorted
+    :rtype: Pandas DataFrame
+    """
+    wide_df = counts_df.set_index(["PlateId", "WellId", "Time", "CellType"])["Count"]
+    wide_df = wide_df.unstack("CellType").reindex(columns=cell_type_list)
+    wide_df.columns.name = None
+    wide_df["TotalCount"] = wide_df[cell_type_list].sum(axis=1)
+    for cell_type in cell_type_list:
+        wide_df["Fraction_%s" % cell_type] = wide_df[cell_type] / wide_df["TotalCount"]
+    return wide_df
+
+
+def query_population_fractions(fraction_table, fraction_window=None, n_images="all"):
+    """Compute the mean fraction of each cell type in every well of every plate
+
+    Gives the same fractions as compute_population_fraction on each plate and well.
+
+    :param fraction_table: the wide table of counts and fractions from build_fraction_table
+    :type fraction_table: Pandas DataFrame
+    :param fraction_window: the time window to average the fractions over, inclusive,
+        defaults to all times
+    :type fraction_window: list[float], optional
+    :param n_images: the number of images of each well to average over, the first images
+        if positive, the last if negative, or "all"
+    :type n_images: int | str
+    :return: the Fraction_{cell type} values of each (PlateId, WellId) with images in the query
+    :rtype: dict[tuple, dict[str, float]]
+    """
+    fractions_df = fraction_table.filter(regex="^Fraction_")
+    if fraction_window is not None:
+        times = fractions_df.index.get_level_values("Time")
+        fractions_df = fractions_df[(times >= fraction_window[0]) & (times <= fraction_window[1])]
+    if n_images != "all":
+        wells = fractions_df.groupby(level=["PlateId", "WellId"])
+        if n_images >= 0:
+            fractions_df = fractions_df[wells.cumcount() < n_images]
+        else:
+            fractions_df = fractions_df[wells.cumcount(ascending=False) < -n_images]
+    # Averaging each well's rows with DataFrame.mean sums them in the same order as
+    # compute_population_fraction, so the fractions are identical to the last bit
+    return {
+        key: well_df.mean().to_dict()
+        for key, well_df in fractions_df.groupby(level=["PlateId", "WellId"])
+    }
+
+
+def calculate_growth_rates(counts_df, growth_rate_window, cell_type_list, fraction_table=None):
+    """Estimate the growth rate, population fractions, and metadata of each cell type in each well
+
+    The counts are grouped by plate, well, and cell type once, instead of being
+    filtered for every combination. Rows are in the order of the plates and wells
+    in the data and of cell_type_list. Combinations without counts are left out.
+
+    :param counts_df: the cell count data, with PlateId, WellId, Time, CellType, and Count columns,
+        and any metadata columns
+    :type counts_df: Pandas DataFrame
+    :param growth_rate_window: the time window to estimate growth rates and fractions in,
+        inclusive
+    :type growth_rate_window: list[float]
+    :param cell_type_list: the cell types to estimate the growth rate of
+    :type cell_type_list: list[str]
+    :param fraction_table: the wide table of the counts from build_fraction_table, to reuse
+        it across growth rate windows, built from counts_df if not given
+    :type fraction_table: Pandas DataFrame, optional
+    :return: a row of growth rates, fractions, and metadata for each plate, well, and cell type
+    :rtype: Pandas DataFrame
+    """
+    group_columns = ["PlateId", "WellId", "CellType"]
     metadata_columns = [
         col
         for col in counts_df.columns
         if col not in ["Time", "Count", "ImageId", "CellType", "WellId", "PlateId"]
     ]
+    # The first row of each group, as the metadata of the group
+    metadata_df = counts_df.drop_duplicates(group_columns).set_index(group_columns)
+    metadata = metadata_df[metadata_columns].to_dict("index")
+    if fraction_table is None:
+        fraction_table = build_fraction_table(counts_df, cell_type_list)
+    fractions = query_population_fractions(fraction_table, fraction_window=growth_rate_window)
+    window_df = counts_df[counts_df["Time"].between(growth_rate_window[0], growth_rate_window[1])]
+    growth_rates = fit_growth_rates(window_df, group_columns, count_threshold=10)
+    no_fractions = {"Fraction_%s" % cell_type: np.nan for cell_type in cell_type_list}
+
     tmp_list = []
     for plate_id, well_id, cell_type in product(
         counts_df["PlateId"].unique(), counts_df["WellId"].unique(), cell_type_list
     ):
-        slope, intercept, low_slope, high_slope = estimate_growth_rate(
-            data_df=counts_df[counts_df["PlateId"] == plate_id],
-            well_id=well_id,
-            cell_type=cell_type,
-            growth_rate_window=growth_rate_window,
-            count_threshold=10,
-        )
-        fractions_dict = compute_population_fraction(
-            counts_df[counts_df["PlateId"] == plate_id],
-            well_id=well_id,
-            fraction_window=growth_rate_window,
-            n_images="all",
-            cell_type_list=cell_type_list,
-        )
-        curr_df = counts_df[
-            (counts_df["PlateId"] == plate_id)
-            & (counts_df["WellId"] == well_id)
-            & (counts_df["CellType"] == cell_type)
-        ]
+        key = (plate_id, well_id, cell_type)
+        if key not in metadata:
+            continue
+        slope, intercept, low_slope, high_slope = growth_rates.get(key, (np.nan,) * 4)
         tmp_list.append(
             {
                 "PlateId": plate_id,
                 "WellId": well_id,
                 "CellType": cell_type,
-                **fractions_dict,
-                **curr_df[metadata_columns].iloc[0].to_dict(),
+                **fractions.get((plate_id, well_id), no_fractions),
+                **metadata[key],
                 "GrowthRate": slope,
                 "GrowthRate_lowerBound": low_slope,
                 "GrowthRate_higherBound": high_slope,
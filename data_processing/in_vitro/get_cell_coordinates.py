@@ -5,71 +5,136 @@ Pink: gfp / sensitive
 
 This script extracts cell location from all images in a given directory.
 Please provide the image directory in the command line when running this file.
-Example: python3 mask_coords.py h358
+Images are processed in parallel by workers processes, which should be 1 in debug mode.
+Example: python3 -m data_processing.in_vitro.get_cell_coordinates h358 -workers 8
 """
 
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import os
-import sys
 
 import cv2
 import numpy as np
 
+CELLS = {"mcherry": (220, 50, 0), "gfp": (200, 0, 200)}
+CSV_HEADER = "ImageID,Timepoint,WellID,CellType,x,y"
 
+
+@lru_cache(maxsize=None)
 def bgr_to_hsv_range(bgr):
     """Convert a color into HSV lower and upper range
 
     Based on:
     https://docs.opencv.org/4.11.0/df/d9d/tutorial_py_colorspaces.html
 
+    Cached, since every image is thresholded with the same few colors.
+
     :param bgr: The BGR values for the color
     :type bgr: tuple[int]
     :return: The lower and upper HSV range for the color
-    :rtype: list[tuple[int]]
+    :rtype: tuple[tuple[int]]
     """
     hsv_color = cv2.cvtColor(np.uint8([[bgr]]), cv2.COLOR_BGR2HSV)
     h = int(hsv_color[0][0][0])
     lower = (h - 10, 100, 100)
     upper = (h + 10, 255, 255)
-    return [lower, upper]
+    return lower, upper
 
 
-def image_to_positions(hsv_image, color):
+def image_to_positions(hsv_image, color, min_area=2):
     """Extract centers of colored cells from HSV image
 
-    Based on:
-    https://www.geeksforgeeks.org/python-opencv-find-center-of-contour/
+    Each 8-connected region of the color's mask is a cell, centered on the
+    mean of its pixels. Regions smaller than min_area pixels are noise.
 
     :param hsv_image: The HSV image of cells
     :type hsv_image: HSV OpenCV Image
     :param color: A tuple with the cells BGR
     :type color: tuple[int]
-    :return: The centers of the cells [(x1,y1),...,(xn,yn)]
-    :rtype: list[tuple[int]]
+    :param min_area: The fewest pixels of a cell, defaults to 2
+    :type min_area: int, optional
+    :return: The centers of the cells, a row of (x, y) per cell
+    :rtype: numpy.ndarray
     """
     # Detect cells
-    mask = cv2.inRange(hsv_image, *bgr_to_hsv_range(color))
+    mask = cv2.inRange(hsv_image, *bgr_to_hsv_range(tuple(color)))
 
-    # Segment cells
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Segment cells and find their centers, skipping the background (label 0)
+    _, _, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(
+        mask, 8, cv2.CV_32S, cv2.CCL_GRANA
+    )
+    is_cell = stats[1:, cv2.CC_STAT_AREA] >= min_area
+    return centroids[1:][is_cell].astype(int)
 
-    # Find midpoints of cell contours
-    coords = []
-    for contour in contours:
-        moments = cv2.moments(contour)
-        moment_0 = moments["m00"]
-        if moment_0 == 0:
-            continue
-        x = int(moments["m10"] / moment_0)
-        y = int(moments["m01"] / moment_0)
-        coords.append((x, y))
 
-    return coords
+def image_to_csv(image_dir, image_name, cells=CELLS):
+    """Save the cell coordinates of one image as a CSV in the image directory
 
+    :param image_dir: The path to the image directory
+    :type image_dir: str
+    :param image_name: The file name of the image, {...}_{well}_{image}_..._{timepoint}.png
+    :type image_name: str
+    :param cells: The BGR color of each cell type
+    :type cells: dict[str, tuple[int]]
+    :return: The centers of each cell type's cells
+    :rtype: dict[str, numpy.ndarray]
+    """
+    # Get identifying image information
+    image_name_split = image_name.split("_")
+    image_id = image_name_split[2]
+    well_id = image_name_split[1]
+    timepoint = image_name_split[-1][:-4]
+
+    # Read image and convert to HSV (easier to segment by color)
+    bgr_image = cv2.imread(os.path.join(image_dir, image_name))
+    hsv_image = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2HSV)
+
+    # Calculate cell positions
+    positions = {
+        cell_name: image_to_positions(hsv_image, cell_color)
+        for cell_name, cell_color in cells.items()
+    }
+
+    # Write CSV
+    rows = np.concatenate(
+        [
+            np.column_stack(
+                [
+                    np.full((len(coords), 4), [image_id, timepoint, well_id, cell_name]),
+                    coords.astype(str),
+                ]
+            )
+            for cell_name, coords in positions.items()
+        ]
+    )
+    csv_name = f"csv_{well_id}_{image_id}_{timepoint}.csv"
+    with open(os.path.join(image_dir, csv_name), "w") as f:
+        f.write("\n".join([CSV_HEADER, *map(",".join, rows.tolist())]) + "\n")
+    return positions
+
+
+def show_positions(image_dir, image_name, positions, cells=CELLS):
+    """Display an image with the cell centers marked and print the cell counts
 
-def main(image_dir, debug=False):
+    Press any key while in the image window to go to the next image
+    """
+    bgr_image = cv2.imread(os.path.join(image_dir, image_name))
+    print(image_name)
+    for cell_name, coords in positions.items():
+        print(f"\t{cell_name} {len(coords)}")
+        opposite_color = [255 - v for v in cells[cell_name]]
+        for x, y in coords:
+            cv2.circle(bgr_image, (int(x), int(y)), 3, opposite_color, -1)
+    cv2.imshow("image", bgr_image)
+    cv2.waitKey(0)
+    cv2.destroyAllWindows()
+
+
+def main(image_dir, debug=False, workers=1):
     """For each image in the directory, save the cell coordinates as a CSV
 
-    Cell types/colors are hardcoded at the beginning of this function
+    Cell types/colors are hardcoded in CELLS
 
     Debug mode will display each image with the cell centers marked,
     along with the cell count information.
@@ -79,55 +144,34 @@ def main(image_dir, debug=False):
     :type image_dir: str
     :param debug: whether to run in debug mode, defaults to False
     :type debug: bool, optional
+    :param workers: the number of processes to segment images in, defaults to 1
+    :type workers: int, optional
     """
-    cells = {"mcherry": (220, 50, 0), "gfp": (200, 0, 200)}
-
-    for image_name in os.listdir(image_dir):
-        # Check if image
-        if image_name[-4:].lower() != ".png":
-            continue
-
-        # Get identifying image information
-        image_name_split = image_name.split("_")
-        image_id = image_name_split[2]
-        well_id = image_name_split[1]
-        timepoint = image_name_split[-1][:-4]
-
-        # Read image
-        bgr_image = cv2.imread(os.path.join(image_dir, image_name))
-
-        # Convert to HSV (easier to segment by color)
-        hsv_image = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2HSV)
-
-        # Calculate cell positions
-        positions = []
-        for cell_name, cell_color in cells.items():
-            coords = image_to_positions(hsv_image, cell_color)
-            positions.append([cell_name, coords])
-
-        # Write CSV
-        csv_name = f"csv_{well_id}_{image_id}_{timepoint}.csv"
-        with open(os.path.join(image_dir, csv_name), "w") as f:
-            f.write("ImageID,Timepoint,WellID,CellType,x,y\n")
-            for cell_name, coords in positions:
-                for x, y in coords:
-                    f.write(f"{image_id},{timepoint},{well_id},{cell_name},{x},{y}\n")
-
-        # Show image with cell centers overlayed (debug mode)
-        if debug:
-            print(image_name)
-            for cell_name, coords in positions:
-                print(f"\t{cell_name} {len(coords)}")
-                opposite_color = [255 - v for v in cells[cell_name]]
-                for coord in coords:
-                    cv2.circle(bgr_image, coord, 3, opposite_color, -1)
-            cv2.imshow("image", bgr_image)
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
+    image_names = [name for name in os.listdir(image_dir) if name[-4:].lower() == ".png"]
+
+    if debug or workers <= 1:
+        for image_name in image_names:
+            positions = image_to_csv(image_dir, image_name)
+            if debug:
+                show_positions(image_dir, image_name, positions)
+        return
+
+    # Each process segments whole images, so the pool scales with the number of images
+    chunksize = max(1, len(image_names) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(
+            image_to_csv,
+            [image_dir] * len(image_names),
+            image_names,
+            chunksize=chunksize,
+        ):
+            pass
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        main(sys.argv[1])
-    else:
-        print("Please provide an image directory.")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image_dir", type=str)
+    parser.add_argument("-workers", "--workers", type=int, default=1)
+    parser.add_argument("-debug", "--debug", action="store_true")
+    args = parser.parse_args()
+    main(args.image_dir, debug=args.debug, workers=args.workers)
@@ -7,6 +7,7 @@ import pandas as pd
 from spatial_egt.common import get_data_path
 from data_processing.in_vitro.pc9.raw_to_processed_payoff import format_raw_df
 from data_processing.in_vitro.game_analysis_utils import calculate_growth_rates, calculate_payoffs
+from data_processing.manifest import get_manifest
 
 
 def main():
@@ -16,12 +17,22 @@ def main():
     parser.add_argument("-start", "--growth_rate_start", type=int, default=24)
     parser.add_argument("-end", "--growth_rate_end", type=int, default=72)
     parser.add_argument("-time", "--time_to_keep", type=int, default=72)
+    parser.add_argument("-hash", "--hash", action="store_true")
+    parser.add_argument("-force", "--force", action="store_true")
     args = parser.parse_args()
 
     raw_data_path = get_data_path(args.data_dir, "raw")
+    data_path = get_data_path(args.data_dir, ".")
     growth_rate_window = [args.growth_rate_start, args.growth_rate_end]
-
-    counts_df = pd.read_csv(f"{raw_data_path}/count_data.csv")
+    counts_path = f"{raw_data_path}/count_data.csv"
+    labels_path = f"{data_path}/labels.csv"
+    manifest = get_manifest(args.data_dir, "raw_to_processed_payoff", args.hash, args.force)
+    params = {"growth_rate_window": growth_rate_window, "time_to_keep": args.time_to_keep}
+    if manifest.is_current(labels_path, [counts_path], params):
+        print(f"{labels_path} is up to date")
+        return
+
+    counts_df = pd.read_csv(counts_path)
     counts_df = counts_df[counts_df["DrugConcentration"] == 0]
     cell_types = ["Sensitive", "Resistant"]
     growth_rate_df = calculate_growth_rates(counts_df, growth_rate_window, cell_types)
@@ -29,8 +40,8 @@ def main():
     df = payoff_df.merge(counts_df, on="DrugConcentration")
     df["time_id"] = f"{(args.time_to_keep // 24):02}d00h00m"
     df = format_raw_df(df, "R2", cell_types[0], args.time_to_keep)
-    data_path = get_data_path(args.data_dir, ".")
-    df.to_csv(f"{data_path}/labels.csv", index=False)
+    df.to_csv(labels_path, index=False)
+    manifest.record(labels_path, [counts_path], params, [labels_path])
 
 
 if __name__ == "__main__":
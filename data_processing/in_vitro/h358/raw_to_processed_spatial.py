@@ -8,15 +8,21 @@ import csv
 
 import pandas as pd
 
+from data_processing.manifest import get_manifest
+from data_processing.processed_samples import FILE_FORMATS, save_processed
 from spatial_egt.common import get_data_path
 
 
+def get_quadrant_paths(raw_data_path, source, well, time):
+    """Get the paths to the coordinates of each of the four quadrants"""
+    return [f"{raw_data_path}/{source}/csv_{well}_{i}_{time}.csv" for i in range(1, 5)]
+
+
 def stitch_coordinates(raw_data_path, source, well, time):
     """Coordinates are split into four quadrants- stitch them back together"""
     df = pd.DataFrame()
-    for i in range(1, 5):
-        file_name = f"csv_{well}_{i}_{time}.csv"
-        df_i = pd.read_csv(f"{raw_data_path}/{source}/{file_name}")
+    for i, quadrant_path in enumerate(get_quadrant_paths(raw_data_path, source, well, time), 1):
+        df_i = pd.read_csv(quadrant_path)
         df_i["part"] = i
         df = pd.concat([df_i, df])
     df = df.reset_index()
@@ -34,11 +40,15 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-dir", "--data_dir", type=str, default="in_vitro_pc9")
     parser.add_argument("-time", "--time_to_keep", type=int, default=72)
+    parser.add_argument("-format", "--file_format", type=str, default="csv", choices=FILE_FORMATS)
+    parser.add_argument("-hash", "--hash", action="store_true")
+    parser.add_argument("-force", "--force", action="store_true")
     args = parser.parse_args()
 
     raw_data_path = get_data_path(args.data_dir, "raw")
     payoff_data_path = get_data_path(args.data_dir, ".")
     processed_data_path = get_data_path(args.data_dir, "processed", args.time_to_keep)
+    manifest = get_manifest(args.data_dir, "raw_to_processed_spatial", args.hash, args.force)
 
     with open(f"{payoff_data_path}/labels.csv", encoding="UTF-8") as payoff_csv:
         reader = csv.DictReader(payoff_csv)
@@ -47,11 +57,18 @@ def main():
             sample = row["sample"]
             well = row["well"]
             time = row["time_id"]
+            output = f"{processed_data_path}/{source} {sample}.csv"
+            inputs = get_quadrant_paths(raw_data_path, source, well, time)
+            params = {"file_format": args.file_format}
+            if manifest.is_current(output, inputs, params):
+                continue
             df = stitch_coordinates(raw_data_path, source, well, time)
             df = df[["x", "y", "CellType"]]
             df = df.rename({"CellType": "type"}, axis=1)
             df["type"] = df["type"].map({"gfp":"sensitive", "mcherry":"resistant"})
-            df.to_csv(f"{processed_data_path}/{source} {sample}.csv", index=False)
+            outputs = save_processed(df, output, args.file_format)
+            manifest.record(output, inputs, params, outputs)
+    manifest.compact()
 
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ import os
 import pandas as pd
 
 from data_processing.in_vitro.game_analysis_utils import calculate_growth_rates, calculate_payoffs
+from data_processing.manifest import get_manifest
 from spatial_egt.common import calculate_game, get_data_path
 
 
@@ -57,6 +58,23 @@ def format_raw_df(df, source, sensitive_type, time_to_keep):
     return df
 
 
+def process_experiment(counts_path, experiment_name, growth_rate_window, time_to_keep):
+    """Calculate the payoffs of each sample in an experiment"""
+    counts_df = pd.read_csv(counts_path)
+    counts_df = counts_df[counts_df["DrugConcentration"] == 0]
+    raw_cell_types = counts_df["CellType"].unique()
+    cell_types = [0, 1]
+    cell_types[0] = [x for x in raw_cell_types if "gfp" in x][0]
+    cell_types[1] = [x for x in raw_cell_types if "mcherry" in x][0]
+    growth_rate_df = calculate_growth_rates(counts_df, growth_rate_window, cell_types)
+    payoff_df = calculate_payoffs(growth_rate_df, cell_types, "SeededProportion_Parental")
+    df_exp = payoff_df.merge(counts_df, on="DrugConcentration")
+    df_exp["time_id"] = df_exp["Time"].rank(method="dense", ascending=True)
+    df_exp["time_id"] = df_exp["time_id"].astype(int)
+    df_exp = format_raw_df(df_exp, experiment_name, cell_types[0], time_to_keep)
+    return df_exp
+
+
 def main():
     """Process count data for each experiment"""
     parser = argparse.ArgumentParser()
@@ -64,29 +82,31 @@ def main():
     parser.add_argument("-start", "--growth_rate_start", type=int, default=24)
     parser.add_argument("-end", "--growth_rate_end", type=int, default=72)
     parser.add_argument("-time", "--time_to_keep", type=int, default=72)
+    parser.add_argument("-hash", "--hash", action="store_true")
+    parser.add_argument("-force", "--force", action="store_true")
     args = parser.parse_args()
 
     raw_data_path = get_data_path(args.data_dir, "raw")
     growth_rate_window = [args.growth_rate_start, args.growth_rate_end]
+    manifest = get_manifest(args.data_dir, "raw_to_processed_payoff", args.hash, args.force)
+    params = {"growth_rate_window": growth_rate_window, "time_to_keep": args.time_to_keep}
 
     df = pd.DataFrame()
     for experiment_name in os.listdir(raw_data_path):
         exp_path = f"{raw_data_path}/{experiment_name}"
         if os.path.isfile(exp_path):
             continue
-        counts_df = pd.read_csv(f"{exp_path}/{experiment_name}_counts_df_processed.csv")
-        counts_df = counts_df[counts_df["DrugConcentration"] == 0]
-        raw_cell_types = counts_df["CellType"].unique()
-        cell_types = [0, 1]
-        cell_types[0] = [x for x in raw_cell_types if "gfp" in x][0]
-        cell_types[1] = [x for x in raw_cell_types if "mcherry" in x][0]
-        growth_rate_df = calculate_growth_rates(counts_df, growth_rate_window, cell_types)
-        payoff_df = calculate_payoffs(growth_rate_df, cell_types, "SeededProportion_Parental")
-        df_exp = payoff_df.merge(counts_df, on="DrugConcentration")
-        df_exp["time_id"] = df_exp["Time"].rank(method="dense", ascending=True)
-        df_exp["time_id"] = df_exp["time_id"].astype(int)
-        df_exp = format_raw_df(df_exp, experiment_name, cell_types[0], args.time_to_keep)
+        counts_path = f"{exp_path}/{experiment_name}_counts_df_processed.csv"
+        entry = manifest.get(counts_path, [counts_path], params)
+        if entry is None:
+            df_exp = process_experiment(
+                counts_path, experiment_name, growth_rate_window, args.time_to_keep
+            )
+            manifest.record(counts_path, [counts_path], params, result=df_exp.to_dict("records"))
+        else:
+            df_exp = pd.DataFrame(entry["result"])
         df = pd.concat([df, df_exp])
+    manifest.compact()
     data_path = get_data_path(args.data_dir, ".")
     df.to_csv(f"{data_path}/labels.csv", index=False)
 
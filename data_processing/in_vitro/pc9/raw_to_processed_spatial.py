@@ -8,6 +8,8 @@ import csv
 
 import pandas as pd
 
+from data_processing.manifest import get_manifest
+from data_processing.processed_samples import FILE_FORMATS, save_processed
 from spatial_egt.common import get_data_path
 
 
@@ -22,15 +24,21 @@ def process_spatial_df(df, time):
     return df
 
 
-def get_spatial_data(data_path, source, plate, well, time):
-    """Read spatial data, format, and return as df"""
+def get_spatial_paths(data_path, source, plate, well):
+    """Get the paths to the sensitive and resistant location files of a well"""
     folder_name = f"results_stitched_images_plate{plate}"
     spatial_file_name = f"segmentation_results_well_{well}_locations"
     full_path = f"{data_path}/{source}/{folder_name}/{spatial_file_name}"
-    s_df = pd.read_csv(f"{full_path}_gfp.csv")
+    return f"{full_path}_gfp.csv", f"{full_path}_mCherry.csv"
+
+
+def get_spatial_data(data_path, source, plate, well, time):
+    """Read spatial data, format, and return as df"""
+    s_path, r_path = get_spatial_paths(data_path, source, plate, well)
+    s_df = pd.read_csv(s_path)
     s_df = process_spatial_df(s_df, time)
     s_df["type"] = "sensitive"
-    r_df = pd.read_csv(f"{full_path}_mCherry.csv")
+    r_df = pd.read_csv(r_path)
     r_df = process_spatial_df(r_df, time)
     r_df["type"] = "resistant"
     df = pd.concat([s_df, r_df])
@@ -43,19 +51,30 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-dir", "--data_dir", type=str, default="in_vitro_pc9")
     parser.add_argument("-time", "--time_to_keep", type=int, default=72)
+    parser.add_argument("-format", "--file_format", type=str, default="csv", choices=FILE_FORMATS)
+    parser.add_argument("-hash", "--hash", action="store_true")
+    parser.add_argument("-force", "--force", action="store_true")
     args = parser.parse_args()
 
     raw_data_path = get_data_path(args.data_dir, "raw")
     payoff_data_path = get_data_path(args.data_dir, ".")
     processed_data_path = get_data_path(args.data_dir, "processed", args.time_to_keep)
+    manifest = get_manifest(args.data_dir, "raw_to_processed_spatial", args.hash, args.force)
 
     with open(f"{payoff_data_path}/labels.csv", encoding="UTF-8") as payoff_csv:
         reader = csv.DictReader(payoff_csv)
         for row in reader:
             source = row["source"]
             sample = row["sample"]
+            output = f"{processed_data_path}/{source} {sample}.csv"
+            inputs = get_spatial_paths(raw_data_path, source, row["plate"], row["well"])
+            params = {"time_id": row["time_id"], "file_format": args.file_format}
+            if manifest.is_current(output, inputs, params):
+                continue
             df = get_spatial_data(raw_data_path, source, row["plate"], row["well"], row["time_id"])
-            df.to_csv(f"{processed_data_path}/{source} {sample}.csv", index=False)
+            outputs = save_processed(df, output, args.file_format)
+            manifest.record(output, inputs, params, outputs)
+    manifest.compact()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+"""Run CellProfiler on every well of a plate concurrently
+
+Each well is segmented by its own CellProfiler process, at most workers at a
+time, with its output in output_dir/{well} and its log in
+output_dir/logs/{well}.log. Failed wells are retried, and wells whose output
+was completed by an earlier run are skipped. The exit status, number of
+attempts, and duration of each well are saved to output_dir/cellprofiler_status.csv.
+
+Expected usage:
+python3 -m data_processing.in_vitro.run_cellprofiler -pipeline pipeline_file
+    -images image_dir -out output_dir (-cellprofiler cellprofiler_command) (-wells well ...)
+    (-workers workers) (-retries retries) (-log_level log_level) (-force)
+
+Where:
+pipeline_file: the CellProfiler pipeline (.cppipe)
+image_dir: the directory of the plate's images, named {well}_..., e.g. B2_1_01.tif
+output_dir: the directory to save each well's output in
+cellprofiler_command: optional, the CellProfiler executable, defaults to cellprofiler,
+    e.g. "python3 -m data_processing.in_vitro.cellprofiler_stub" to test without CellProfiler
+well: optional, the wells to segment, defaults to every well with images
+workers: optional, the number of wells to segment at once
+retries: optional, the number of times to retry a failed well
+log_level: optional, the CellProfiler log level, 10 (debug) to 50 (critical)
+force: optional, segment wells even if they are already complete
+"""
+
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import re
+import shlex
+import subprocess
+import time
+
+import pandas as pd
+
+COMPLETE_MARKER = ".cellprofiler_complete"
+
+WellResult = namedtuple(
+    "WellResult", ["well_id", "status", "returncode", "attempts", "duration", "log_path"]
+)
+
+
+def get_well_ids(dir_to_analyse):
+    """Get the wells with images in a directory, in plate order (B2, B3, ..., B10, C2, ...)
+
+    :param dir_to_analyse: the directory of images, named with the well before the first _
+    :type dir_to_analyse: str
+    :return: the well ids
+    :rtype: list[str]
+    """
+    well_ids = {
+        entry.name.split("_")[0]
+        for entry in os.scandir(dir_to_analyse)
+        if entry.is_file() and not entry.name.startswith(".") and "_" in entry.name
+    }
+
+    def plate_order(well_id):
+        match = re.fullmatch(r"([A-Za-z]+)(\d+)", well_id)
+        return (match.group(1), int(match.group(2))) if match else (well_id, 0)
+
+    return sorted(well_ids, key=plate_order)
+
+
+def get_cellprofiler_command(
+    cellprofiler_path, pipeline_file, dir_to_analyse, out_dir, well_id, var_name_well, log_level
+):
+    """Get the arguments of a headless CellProfiler run on one well
+
+    The same command as game_analysis_utils.run_cellprofiler_on_well, as a list
+    of arguments so no shell is needed. cellprofiler_path may include arguments.
+    """
+    return [
+        *shlex.split(cellprofiler_path),
+        "-c",
+        "-r",
+        "-p",
+        pipeline_file,
+        "-i",
+        dir_to_analyse,
+        "-o",
+        out_dir,
+        "-g",
+        f"{var_name_well}={well_id}",
+        "-L",
+        str(log_level),
+    ]
+
+
+def is_complete(out_dir):
+    """Whether a well's output directory was completed by a successful run"""
+    return os.path.exists(os.path.join(out_dir, COMPLETE_MARKER))
+
+
+def run_well(
+    well_id,
+    cellprofiler_path,
+    pipeline_file,
+    dir_to_analyse,
+    output_dir,
+    retries=1,
+    var_name_well="Metadata_Well",
+    log_level=50,
+):
+    """Run CellProfiler on one well, retrying on failure, and log its output
+
+    :return: the status (succeeded or failed), exit code, number of attempts,
+        duration in seconds, and log path of the well
+    :rtype: WellResult
+    """
+    out_dir = os.path.join(output_dir, well_id)
+    os.makedirs(out_dir, exist_ok=True)
+    marker_path = os.path.join(out_dir, COMPLETE_MARKER)
+    if os.path.exists(marker_path):
+        os.remove(marker_path)
+    log_path = os.path.join(output_dir, "logs", f"{well_id}.log")
+    command = get_cellprofiler_command(
+        cellprofiler_path, pipeline_file, dir_to_analyse, out_dir, well_id, var_name_well, log_level
+    )
+    start = time.perf_counter()
+    returncode = None
+    attempts = 0
+    with open(log_path, "w") as log:
+        while attempts <= retries:
+            attempts += 1
+            log.write(f"Attempt {attempts}: {shlex.join(command)}\n")
+            log.flush()
+            try:
+                returncode = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT).returncode
+            except OSError as error:
+                log.write(f"{error}\n")
+                returncode = None
+            log.write(f"Exit code {returncode}\n")
+            log.flush()
+            if returncode == 0:
+                break
+    duration = time.perf_counter() - start
+    status = "succeeded" if returncode == 0 else "failed"
+    if status == "succeeded":
+        with open(marker_path, "w") as f:
+            json.dump({"command": command, "attempts": attempts, "duration": duration}, f)
+    return WellResult(well_id, status, returncode, attempts, duration, log_path)
+
+
+def run_plate(
+    well_ids,
+    cellprofiler_path,
+    pipeline_file,
+    dir_to_analyse,
+    output_dir,
+    workers=4,
+    retries=1,
+    var_name_well="Metadata_Well",
+    log_level=50,
+    force=False,
+):
+    """Run CellProfiler on wells concurrently, at most workers at a time
+
+    :param well_ids: the wells to segment
+    :type well_ids: list[str]
+    :param force: whether to segment wells that are already complete
+    :type force: bool
+    :return: the result of each well, in the order of well_ids
+    :rtype: list[WellResult]
+    """
+    os.makedirs(os.path.join(output_dir, "logs"), exist_ok=True)
+    results = {}
+    to_run = []
+    for well_id in well_ids:
+        if not force and is_complete(os.path.join(output_dir, well_id)):
+            results[well_id] = WellResult(well_id, "skipped", None, 0, 0.0, None)
+        else:
+            to_run.append(well_id)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(
+                run_well,
+                well_id,
+                cellprofiler_path,
+                pipeline_file,
+                dir_to_analyse,
+                output_dir,
+                retries,
+                var_name_well,
+                log_level,
+            )
+            for well_id in to_run
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.well_id] = result
+            print(
+                f"{result.well_id} {result.status} in {result.duration:.1f}s "
+                f"after {result.attempts} attempt(s)"
+            )
+    return [results[well_id] for well_id in well_ids]
+
+
+def main():
+    """Segment every well of a plate with CellProfiler and save the status of each well"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-pipeline", "--pipeline_file", type=str, required=True)
+    parser.add_argument("-images", "--dir_to_analyse", type=str, required=True)
+    parser.add_argument("-out", "--output_dir", type=str, required=True)
+    parser.add_argument("-cellprofiler", "--cellprofiler_path", type=str, default="cellprofiler")
+    parser.add_argument("-wells", "--well_ids", type=str, nargs="+", default=None)
+    parser.add_argument("-workers", "--workers", type=int, default=4)
+    parser.add_argument("-retries", "--retries", type=int, default=1)
+    parser.add_argument("-log_level", "--log_level", type=int, default=50)
+    parser.add_argument("-force", "--force", action="store_true")
+    args = parser.parse_args()
+
+    well_ids = args.well_ids
+    if well_ids is None:
+        well_ids = get_well_ids(args.dir_to_analyse)
+    results = run_plate(
+        well_ids,
+        args.cellprofiler_path,
+        args.pipeline_file,
+        args.dir_to_analyse,
+        args.output_dir,
+        workers=args.workers,
+        retries=args.retries,
+        log_level=args.log_level,
+        force=args.force,
+    )
+    status_df = pd.DataFrame(results, columns=WellResult._fields)
+    status_df.to_csv(os.path.join(args.output_dir, "cellprofiler_status.csv"), index=False)
+    counts = status_df["status"].value_counts()
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    failed = status_df[status_df["status"] == "failed"]
+    for _, row in failed.iterrows():
+        print(f"\t{row['well_id']} failed with exit code {row['returncode']}, see {row['log_path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Theil-Sen estimator of many short series at once
+
+Computes the same slope, intercept, and confidence bounds as
+scipy.stats.theilslopes (with its default "separate" intercept) for every
+series in one set of array operations, instead of one scipy call per
+series. Series of different lengths are padded with NaN.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from scipy import stats
+
+TheilslopesBatchResult = namedtuple(
+    "TheilslopesBatchResult", ["slope", "intercept", "low_slope", "high_slope"]
+)
+
+
+def pad_series(series_list):
+    """Pad series of different lengths with NaN into the rows of a 2D array
+
+    :param series_list: the series
+    :type series_list: list[array-like]
+    :return: an array with a row for each series
+    :rtype: numpy.ndarray
+    """
+    lengths = [len(series) for series in series_list]
+    padded = np.full((len(series_list), max(lengths, default=0)), np.nan)
+    for i, series in enumerate(series_list):
+        padded[i, : lengths[i]] = series
+    return padded
+
+
+def _sorted_median(sorted_values, counts):
+    """Get the median of the first counts values of each sorted row, as np.median computes it"""
+    rows = np.arange(len(sorted_values))
+    last = max(sorted_values.shape[1] - 1, 0)
+    lower = sorted_values[rows, np.clip((counts - 1) // 2, 0, last)]
+    upper = sorted_values[rows, np.clip(counts // 2, 0, last)]
+    median = np.where(counts % 2 == 1, upper, (lower + upper) / 2)
+    return np.where(counts > 0, median, np.nan)
+
+
+def _sum_ties(values):
+    """Sum k * (k - 1) * (2k + 5) over the groups of k tied values of each row, ignoring NaN"""
+    equal = values[:, :, np.newaxis] == values[:, np.newaxis, :]
+    # Each of the k values of a group has k equal values, so each adds a k-th of the group's term
+    ties = equal.sum(axis=2)
+    return np.where(ties > 0, (ties - 1) * (2 * ties + 5), 0).sum(axis=1)
+
+
+def theilslopes_batch(y, x=None, alpha=0.95):
+    """Theil-Sen estimate of each row of y against the same row of x
+
+    Matches scipy.stats.theilslopes(y[i], x[i], alpha) for every row with at
+    least two values, where scipy raises instead, giving NaN.
+
+    :param y: the dependent variable, a row per series, padded with NaN
+    :type y: array-like
+    :param x: the independent variable, the same shape as y, defaults to 0, 1, 2, ...
+    :type x: array-like, optional
+    :param alpha: the confidence level of the bounds of the slope
+    :type alpha: float
+    :return: the median slope, intercept, and lower and upper bounds of the slope of each row
+    :rtype: TheilslopesBatchResult
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    if x is None:
+        x = np.where(np.isnan(y), np.nan, np.arange(y.shape[1], dtype=float))
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    if x.shape != y.shape:
+        raise ValueError("Array shapes are incompatible for broadcasting.")
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    x = np.where(valid, x, np.nan)
+    y = np.where(valid, y, np.nan)
+    num_values = valid.sum(axis=1)
+
+    # Slopes of every pair of values with increasing x, sorted with the other pairs (NaN) last
+    delta_x = x[:, :, np.newaxis] - x[:, np.newaxis, :]
+    delta_y = y[:, :, np.newaxis] - y[:, np.newaxis, :]
+    increasing = delta_x > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slopes = np.where(increasing, delta_y / delta_x, np.nan).reshape(len(y), -1)
+    slopes.sort(axis=1)
+    num_slopes = increasing.reshape(len(y), -1).sum(axis=1)
+    slope = _sorted_median(slopes, num_slopes)
+    intercept = _sorted_median(np.sort(y, axis=1), num_values) - slope * _sorted_median(
+        np.sort(x, axis=1), num_values
+    )
+
+    # Confidence bounds of the slope, from equation 2.6 of Sen (1968)
+    if alpha > 0.5:
+        alpha = 1.0 - alpha
+    z = stats.norm.ppf(alpha / 2.0)
+    sigsq = 1 / 18.0 * (
+        num_values * (num_values - 1) * (2 * num_values + 5) - _sum_ties(x) - _sum_ties(y)
+    )
+    with np.errstate(invalid="ignore"):
+        sigma = np.sqrt(sigsq)
+    defined = ~np.isnan(sigma) & (num_slopes > 0)
+    sigma = np.where(defined, sigma, 0)
+    upper_index = np.minimum(np.round((num_slopes - z * sigma) / 2.0), num_slopes - 1)
+    lower_index = np.maximum(np.round((num_slopes + z * sigma) / 2.0) - 1, 0)
+    rows = np.arange(len(y))
+    last = max(slopes.shape[1] - 1, 0)
+    low_slope = slopes[rows, np.clip(lower_index, 0, last).astype(np.int64)]
+    high_slope = slopes[rows, np.clip(upper_index, 0, last).astype(np.int64)]
+
+    too_short = num_values < 2
+    slope[too_short] = np.nan
+    intercept[too_short] = np.nan
+    low_slope = np.where(defined & ~too_short, low_slope, np.nan)
+    high_slope = np.where(defined & ~too_short, high_slope, np.nan)
+    return TheilslopesBatchResult(slope, intercept, low_slope, high_slope)
@@ -0,0 +1,153 @@
+"""Manifest of processed outputs for incremental and resumable processing
+
+Each entry records the fingerprints of the input files and the parameters
+an output was made from. Entries are appended to a JSON lines file as soon
+as each output is done, so an interrupted run resumes where it stopped,
+and a rerun only reprocesses outputs whose inputs or parameters changed.
+"""
+
+import hashlib
+import json
+import os
+
+from spatial_egt.common import get_data_path
+
+
+def fingerprint(path, use_hash=False):
+    """Get the size, modification time, and optionally the hash of a file
+
+    :param path: the path to the file
+    :type path: str
+    :param use_hash: whether to include the SHA-256 of the file contents
+    :type use_hash: bool
+    :return: the fingerprint, or None if the file does not exist
+    :rtype: dict | None
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    file_fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if use_hash:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        file_fingerprint["sha256"] = sha.hexdigest()
+    return file_fingerprint
+
+
+def _normalize(value):
+    """Round trip through JSON so recorded and new values compare equal"""
+    return json.loads(json.dumps(value))
+
+
+class Manifest:
+    """Input fingerprints and parameters of each processed output
+
+    :param path: the path to the manifest JSON lines file
+    :type path: str
+    :param use_hash: whether to compare file hashes in addition to size and mtime
+    :type use_hash: bool
+    :param force: whether to treat every entry as out of date
+    :type force: bool
+    """
+
+    def __init__(self, path, use_hash=False, force=False):
+        self.path = path
+        self.use_hash = use_hash
+        self.force = force
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="UTF-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A run interrupted mid-write can leave a partial last line
+                        continue
+                    self.entries[entry["key"]] = entry
+
+    def fingerprints(self, inputs):
+        return {path: fingerprint(path, self.use_hash) for path in inputs}
+
+    def get(self, key, inputs, params):
+        """Get the entry of a key if it is up to date with the inputs and parameters
+
+        :param key: the identifier of the output, usually its path
+        :type key: str
+        :param inputs: the paths of the files the output is made from,
+            including optional files, whose absence is also recorded
+        :type inputs: list[str]
+        :param params: the parameters the output is made with
+        :type params: dict
+        :return: the entry, or None if the output needs to be (re)made
+        :rtype: dict | None
+        """
+        if self.force:
+            return None
+        entry = self.entries.get(key)
+        if entry is None or entry["params"] != _normalize(params):
+            return None
+        if not all(os.path.exists(output) for output in entry["outputs"]):
+            return None
+        recorded = entry["inputs"]
+        if set(recorded) != set(inputs):
+            return None
+        if not all(self._matches(path, recorded[path]) for path in inputs):
+            return None
+        return entry
+
+    def _matches(self, path, recorded):
+        """Compare a file to its recorded fingerprint, by hash if both have one"""
+        if recorded is None:
+            return not os.path.exists(path)
+        if self.use_hash and "sha256" in recorded:
+            current = fingerprint(path, use_hash=True)
+            keys = ["size", "sha256"]
+        else:
+            current = fingerprint(path)
+            keys = ["size", "mtime_ns"]
+        return current is not None and all(current[k] == recorded[k] for k in keys)
+
+    def is_current(self, key, inputs, params):
+        return self.get(key, inputs, params) is not None
+
+    def record(self, key, inputs, params, outputs=None, result=None):
+        """Record that an output was made, appending the entry to the manifest file
+
+        :param key: the identifier of the output, usually its path
+        :type key: str
+        :param inputs: the paths of the files the output was made from
+        :type inputs: list[str]
+        :param params: the parameters the output was made with
+        :type params: dict
+        :param outputs: the files that must exist for the entry to be current
+        :type outputs: list[str], optional
+        :param result: a JSON serializable result to reuse on later runs
+        :type result: Any, optional
+        """
+        entry = {
+            "key": key,
+            "inputs": self.fingerprints(inputs),
+            "params": _normalize(params),
+            "outputs": [] if outputs is None else list(outputs),
+            "result": _normalize(result),
+        }
+        self.entries[key] = entry
+        with open(self.path, "a", encoding="UTF-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def compact(self):
+        """Rewrite the manifest file with only the latest entry of each key"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="UTF-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+def get_manifest(data_type, name, use_hash=False, force=False):
+    """Get the manifest of a processing step of a data type"""
+    manifest_path = get_data_path(data_type, "manifests")
+    return Manifest(f"{manifest_path}/{name}.jsonl", use_hash, force)
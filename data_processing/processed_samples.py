@@ -0,0 +1,143 @@
+"""Save and load processed spatial samples
+
+A processed sample is a table of cell type and x, y coordinates, saved as
+"{source} {sample}.csv". It can also be saved as a binary .npy sidecar
+holding a structured array (uint8 type, int32 x and y), which is
+memory-mapped on load instead of parsed.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+CELL_TYPE_CODES = {"sensitive": 0, "resistant": 1}
+CELL_TYPE_NAMES = {code: name for name, code in CELL_TYPE_CODES.items()}
+SAMPLE_DTYPE = np.dtype([("type", "u1"), ("x", "i4"), ("y", "i4")])
+FILE_FORMATS = ["csv", "npy", "both"]
+
+
+def get_sidecar_path(csv_path):
+    """Get the path of the binary sidecar of a processed csv"""
+    return os.path.splitext(csv_path)[0] + ".npy"
+
+
+def get_tmp_path(path):
+    """Get a temporary path to write a file to before moving it into place, unique to the process"""
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def to_sample_array(df):
+    """Convert a processed sample dataframe into a structured array
+
+    :param df: the processed sample, with type, x, and y columns
+    :type df: Pandas DataFrame
+    :return: the sample as a structured array of SAMPLE_DTYPE
+    :rtype: numpy.ndarray
+    """
+    types = df["type"].map(CELL_TYPE_CODES)
+    if types.isna().any():
+        unknown = df.loc[types.isna(), "type"].unique()
+        raise ValueError(f"Unknown cell types: {unknown}")
+    sample = np.empty(len(df), dtype=SAMPLE_DTYPE)
+    sample["type"] = types.to_numpy()
+    sample["x"] = df["x"].to_numpy()
+    sample["y"] = df["y"].to_numpy()
+    return sample
+
+
+def get_processed_paths(csv_path, file_format="csv"):
+    """Get the paths a processed sample is saved to in the given file format"""
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"File format must be one of {FILE_FORMATS}")
+    paths = []
+    if file_format in ["csv", "both"]:
+        paths.append(csv_path)
+    if file_format in ["npy", "both"]:
+        paths.append(get_sidecar_path(csv_path))
+    return paths
+
+
+def save_processed(df, csv_path, file_format="csv"):
+    """Save a processed sample as csv, as a binary sidecar, or both
+
+    A sidecar left from an earlier save is removed when saving only the csv,
+    and a csv left from an earlier save is removed when saving only the
+    sidecar, so nothing reads a file that is out of date. Each file is
+    written to a temporary file and then moved into place, so a reader never
+    sees a partly written file.
+
+    :param df: the processed sample, with type, x, and y columns
+    :type df: Pandas DataFrame
+    :param csv_path: the path of the processed csv
+    :type csv_path: str
+    :param file_format: one of csv, npy, or both
+    :type file_format: str
+    :return: the paths of the saved files
+    :rtype: list[str]
+    """
+    paths = get_processed_paths(csv_path, file_format)
+    if csv_path in paths:
+        tmp_path = get_tmp_path(csv_path)
+        df[["type", "x", "y"]].to_csv(tmp_path, index=False)
+        os.replace(tmp_path, csv_path)
+    elif os.path.exists(csv_path):
+        os.remove(csv_path)
+    sidecar_path = get_sidecar_path(csv_path)
+    if sidecar_path in paths:
+        tmp_path = get_tmp_path(sidecar_path)
+        with open(tmp_path, "wb") as f:
+            np.save(f, to_sample_array(df))
+        os.replace(tmp_path, sidecar_path)
+    elif os.path.exists(sidecar_path):
+        os.remove(sidecar_path)
+    return paths
+
+
+def load_processed_array(csv_path, mmap=True):
+    """Load a processed sample as a structured array
+
+    Memory-maps the binary sidecar when it exists, otherwise parses the csv.
+
+    :param csv_path: the path of the processed csv
+    :type csv_path: str
+    :param mmap: whether to memory-map the sidecar rather than read it
+    :type mmap: bool
+    :return: the sample as a structured array of SAMPLE_DTYPE
+    :rtype: numpy.ndarray
+    """
+    sidecar_path = get_sidecar_path(csv_path)
+    if os.path.exists(sidecar_path):
+        return np.load(sidecar_path, mmap_mode="r" if mmap else None)
+    return to_sample_array(pd.read_csv(csv_path))
+
+
+def load_processed(csv_path):
+    """Load a processed sample as a dataframe, from its sidecar if it exists
+
+    :param csv_path: the path of the processed csv
+    :type csv_path: str
+    :return: the processed sample with type, x, and y columns
+    :rtype: Pandas DataFrame
+    """
+    sidecar_path = get_sidecar_path(csv_path)
+    if not os.path.exists(sidecar_path):
+        return pd.read_csv(csv_path)
+    sample = np.load(sidecar_path, mmap_mode="r")
+    return pd.DataFrame(
+        {
+            "type": pd.Series(sample["type"]).map(CELL_TYPE_NAMES),
+            "x": sample["x"],
+            "y": sample["y"],
+        }
+    )
+
+
+def list_processed(processed_data_path):
+    """Get the csv path of each processed sample, whether saved as csv, npy, or both"""
+    names = set()
+    for file_name in os.listdir(processed_data_path):
+        name, extension = os.path.splitext(file_name)
+        if extension in [".csv", ".npy"]:
+            names.add(name)
+    return [f"{processed_data_path}/{name}.csv" for name in sorted(names)]
@@ -0,0 +1,304 @@
+"""Calculate many spatial statistics of each processed sample in one pass
+
+Loads each processed sample once and calculates every requested statistic of
+STATISTIC_REGISTRY on it, sharing the sample's spatial structures between
+statistics, instead of running one job per statistic that reloads every sample.
+Each statistic is saved to statistics/{statistic}.pkl with source, sample,
+and statistic columns. Values are looked up in and saved to the statistic
+cache, so only statistics of new samples or with changed parameters are calculated.
+Cheap statistics with a batched counterpart, such as the proportion sensitive
+and the neighbourhood composition when its native backend is selected in
+STATISTIC_BACKENDS, are calculated for many samples at once instead of one
+sample at a time. With a budget, the statistics in
+APPROXIMATE_STATISTICS are calculated from at most budget cells of each sample,
+with the bounds of a bootstrap confidence interval in {statistic}_lower and
+{statistic}_upper columns. Native CPCF and cross K statistics bootstrap a
+sample of budget focal cells; other statistics are the mean over num_subsamples
+subsamples of budget cells, with a bootstrap interval of that mean.
+
+Expected usage:
+python3 -m data_processing.processed_to_statistics -dir data_type (-time time)
+    (-stats statistic ...) (-workers workers) (-cache cache_path) (-cache_size size) (-no_cache)
+    (-budget budget) (-bootstrap num_bootstrap) (-subsamples num_subsamples)
+
+Where:
+data_type: the name of the directory in data/ containing the processed/ data
+time: optional, the time step of the processed data
+statistic: optional, the names of the statistics to calculate, defaults to all
+workers: optional, the number of processes to use
+cache_path: optional, the path to the statistic cache
+size: optional, the size to keep the statistic cache within in MB
+no_cache: optional, calculate every statistic without the cache
+budget: optional, the number of cells to calculate approximate statistics from,
+    defaults to calculating every statistic exactly
+num_bootstrap: optional, the number of bootstrap replicates of the confidence intervals
+num_subsamples: optional, the number of subsamples of approximate statistics other than
+    native CPCF and cross K
+"""
+
+import argparse
+from collections import namedtuple
+import os
+import traceback
+
+import pandas as pd
+
+from data_processing.in_silico.dataset import ProcessingReport, run_work_items
+from data_processing.processed_samples import list_processed, load_processed
+from data_processing.spatial_statistics.approximate import approximate
+from data_processing.spatial_statistics.batched import BATCHED_STATISTICS, pack_samples
+from data_processing.spatial_statistics.context import SpatialContext
+from data_processing.spatial_statistics.pair_correlation import PAIR_STATISTICS, get_pair_radius
+from data_processing.statistic_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_SIZE, StatisticCache
+from spatial_database import (
+    APPROXIMATE_STATISTICS,
+    STATISTIC_BACKENDS,
+    STATISTIC_PARAMS,
+    STATISTIC_REGISTRY,
+)
+from spatial_egt.common import get_data_path
+
+BATCH_SIZE = 1000
+
+Sample = namedtuple(
+    "Sample", ["source", "sample", "path", "statistics", "approximate"], defaults=[None]
+)
+SampleBatch = namedtuple("SampleBatch", ["paths", "statistics"])
+
+
+def get_sample(sample_path, statistics, approximate=None):
+    """Get the source and sample name of a processed sample from its file name"""
+    name = os.path.splitext(os.path.basename(sample_path))[0]
+    source, sample = name.split(" ", 1)
+    return Sample(source, sample, sample_path, statistics, approximate)
+
+
+def is_approximated(name, approximate):
+    """Whether a statistic is calculated approximately with the given approximation settings"""
+    return approximate is not None and name in APPROXIMATE_STATISTICS
+
+
+def get_cache_params(name, approximate=None):
+    """Get the parameters a statistic's value is cached under, including its backend"""
+    params = {
+        "backend": STATISTIC_BACKENDS.get(name, "spatial_egt"),
+        **STATISTIC_PARAMS.get(name, {}),
+    }
+    if is_approximated(name, approximate):
+        params["approximate"] = approximate
+    return params
+
+
+def get_min_pair_radius(statistics):
+    """Get the radius to build pair histograms to so every CPCF and K statistic can share them"""
+    radii = [
+        get_pair_radius(STATISTIC_PARAMS[name])
+        for name in statistics
+        if STATISTIC_REGISTRY[name] in PAIR_STATISTICS
+    ]
+    return max(radii, default=0)
+
+
+def is_batched(name):
+    """Whether a statistic has a batched counterpart that calculates many samples at once"""
+    return STATISTIC_REGISTRY[name] in BATCHED_STATISTICS
+
+
+def calculate_statistics(sample):
+    """Calculate the statistics of a single processed sample
+
+    A statistic that raises is recorded as an error and left out,
+    so it does not stop the others from being calculated.
+
+    :param sample: the processed sample, the names of the statistics to calculate,
+        and the keyword arguments of approximate, or None to calculate them exactly
+    :type sample: Sample
+    :return: the value of each statistic that was calculated, as a tuple of the value and
+        its confidence interval bounds if it was approximated,
+        and the traceback of each statistic that failed
+    :rtype: tuple[dict[str, Any], dict[str, str]]
+    """
+    ctx = SpatialContext(load_processed(sample.path), get_min_pair_radius(sample.statistics))
+    values = {}
+    errors = {}
+    for name in sample.statistics:
+        params = STATISTIC_PARAMS.get(name, {})
+        try:
+            if is_approximated(name, sample.approximate):
+                func = STATISTIC_REGISTRY[name]
+                values[name] = approximate(func, ctx, params, **sample.approximate)
+            else:
+                values[name] = STATISTIC_REGISTRY[name](ctx, **params)
+        except Exception:
+            errors[name] = traceback.format_exc()
+    return values, errors
+
+
+def calculate_batch(batch):
+    """Calculate statistics with a batched counterpart of many processed samples at once
+
+    :param batch: the processed samples and the names of the statistics to calculate
+    :type batch: SampleBatch
+    :return: the value of each statistic of each sample, in the order of the samples,
+        and the traceback of each statistic that failed
+    :rtype: tuple[dict[str, list], dict[str, str]]
+    """
+    ragged = pack_samples([load_processed(path) for path in batch.paths])
+    values = {}
+    errors = {}
+    for name in batch.statistics:
+        try:
+            batched = BATCHED_STATISTICS[STATISTIC_REGISTRY[name]]
+            values[name] = batched(ragged, **STATISTIC_PARAMS.get(name, {}))
+        except Exception:
+            errors[name] = traceback.format_exc()
+    return values, errors
+
+
+def evaluate_statistics(
+    data_type, time, statistics, workers=1, cache=None, report=None, approximate=None
+):
+    """Calculate statistics of each processed sample, reusing cached values
+
+    :param data_type: the name of the directory in data/ containing the processed/ data
+    :type data_type: str
+    :param time: the time step of the processed data
+    :type time: int | None
+    :param statistics: the names of the statistics to calculate
+    :type statistics: list[str]
+    :param workers: the number of processes to use
+    :type workers: int
+    :param cache: the cache to look values up in and save new values to
+    :type cache: StatisticCache, optional
+    :param report: the report to record failures in
+    :type report: ProcessingReport, optional
+    :param approximate: the keyword arguments of approximate to calculate the statistics
+        in APPROXIMATE_STATISTICS with, such as the budget, or None to calculate them exactly
+    :type approximate: dict, optional
+    :return: a dataframe of each statistic, with source, sample, and statistic columns,
+        and statistic_lower and statistic_upper columns if it was approximated
+    :rtype: dict[str, Pandas DataFrame]
+    """
+    unknown = [name for name in statistics if name not in STATISTIC_REGISTRY]
+    if unknown:
+        raise ValueError(f"Unknown statistics {unknown}, must be in {list(STATISTIC_REGISTRY)}")
+    report = ProcessingReport() if report is None else report
+    processed_data_path = get_data_path(data_type, "processed", time)
+    sample_paths = list_processed(processed_data_path)
+    cache_params = {name: get_cache_params(name, approximate) for name in statistics}
+    values = {}
+    sample_hashes = {}
+    samples = []
+    batch_paths = []
+    batch_statistics = set()
+    for sample_path in sample_paths:
+        missing = statistics
+        if cache is not None:
+            sample_hash = cache.hash_sample(sample_path)
+            sample_hashes[sample_path] = sample_hash
+            cached = cache.get_many(sample_hash, cache_params)
+            for name, value in cached.items():
+                values[(sample_path, name)] = value
+            missing = [name for name in statistics if name not in cached]
+        if not missing:
+            report.skipped += 1
+            continue
+        unbatched = [name for name in missing if not is_batched(name)]
+        if unbatched:
+            samples.append(get_sample(sample_path, unbatched, approximate))
+        if len(unbatched) < len(missing):
+            batch_paths.append(sample_path)
+            batch_statistics.update(name for name in missing if is_batched(name))
+    batch_statistics = [name for name in statistics if name in batch_statistics]
+    batches = [
+        SampleBatch(batch_paths[i : i + BATCH_SIZE], batch_statistics)
+        for i in range(0, len(batch_paths), BATCH_SIZE)
+    ]
+
+    def save(sample_path, sample_values):
+        if cache is not None:
+            sample_hash = sample_hashes[sample_path]
+            cache.put_many(
+                [(sample_hash, name, cache_params[name], v) for name, v in sample_values.items()]
+            )
+
+    def record(sample, result):
+        sample_values, errors = result
+        for name, value in sample_values.items():
+            values[(sample.path, name)] = value
+        for name, error in errors.items():
+            report.add_missing(sample.path, f"{name} failed\n{error}")
+        save(sample.path, sample_values)
+
+    def record_batch(batch, result):
+        batch_values, errors = result
+        for i, sample_path in enumerate(batch.paths):
+            # Every statistic of the batch is calculated for every sample in it,
+            # but only the ones that were not cached are recorded
+            sample_values = {
+                name: batch_values[name][i]
+                for name in batch_values
+                if (sample_path, name) not in values
+            }
+            values.update({(sample_path, name): v for name, v in sample_values.items()})
+            for name, error in errors.items():
+                report.add_missing(sample_path, f"{name} failed\n{error}")
+            save(sample_path, sample_values)
+
+    run_work_items(calculate_batch, batches, workers, report, on_result=record_batch)
+    run_work_items(calculate_statistics, samples, workers, report, on_result=record)
+
+    dfs = {}
+    for name in statistics:
+        columns = ["source", "sample", name]
+        if is_approximated(name, approximate):
+            columns += [f"{name}_lower", f"{name}_upper"]
+        rows = []
+        for sample_path in sample_paths:
+            if (sample_path, name) in values:
+                sample = get_sample(sample_path, None)
+                value = values[(sample_path, name)]
+                value = value if is_approximated(name, approximate) else (value,)
+                rows.append([sample.source, sample.sample, *value])
+        dfs[name] = pd.DataFrame(rows, columns=columns)
+    return dfs
+
+
+def main():
+    """Calculate and save the requested statistics of each processed sample"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-dir", "--data_type", type=str, default="in_silico")
+    parser.add_argument("-time", "--time", type=int, default=None)
+    parser.add_argument("-stats", "--statistics", type=str, nargs="+", default=None)
+    parser.add_argument("-workers", "--workers", type=int, default=1)
+    parser.add_argument("-cache", "--cache_path", type=str, default=DEFAULT_CACHE_PATH)
+    parser.add_argument("-cache_size", "--cache_size", type=float, default=DEFAULT_MAX_SIZE)
+    parser.add_argument("-no_cache", "--no_cache", action="store_true")
+    parser.add_argument("-budget", "--budget", type=int, default=None)
+    parser.add_argument("-bootstrap", "--num_bootstrap", type=int, default=200)
+    parser.add_argument("-subsamples", "--num_subsamples", type=int, default=10)
+    args = parser.parse_args()
+
+    statistics = list(STATISTIC_REGISTRY) if args.statistics is None else args.statistics
+    cache = None if args.no_cache else StatisticCache(args.cache_path, args.cache_size)
+    report = ProcessingReport()
+    approximate = None
+    if args.budget is not None:
+        approximate = {
+            "budget": args.budget,
+            "num_bootstrap": args.num_bootstrap,
+            "num_subsamples": args.num_subsamples,
+        }
+    dfs = evaluate_statistics(
+        args.data_type, args.time, statistics, args.workers, cache, report, approximate
+    )
+    statistics_data_path = get_data_path(args.data_type, "statistics", args.time)
+    for name, df in dfs.items():
+        df.to_pickle(f"{statistics_data_path}/{name}.pkl")
+    if cache is not None:
+        cache.close()
+    report.print_summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Approximate statistics of large samples within a compute budget
+
+Stitched in vitro images have far more cells than the ABM grids, so pair
+statistics of every cell are expensive. Instead, about budget cells are
+used, drawn with stratified sampling over a grid of the bounding box so that
+every region of the image is represented in proportion to its cells, and a
+bootstrap confidence interval is reported with each value.
+
+Native pair statistics (CPCF and cross K) count the pairs of a subsample of
+focal cells of the first type with every cell of the second type, so their
+estimates are unbiased and the interval reflects the sampling of focal cells.
+Other statistics, such as the Wasserstein distance and the spatial_egt CPCF
+and cross K, are calculated on repeated subsamples of all cells, and the
+value is their mean. Their interval is of the mean, from a bootstrap of the
+subsample values, so it narrows with more subsamples. It covers the variation
+between subsamples, but not the bias of calculating a statistic on fewer
+cells, which for distances between point clouds is upward.
+"""
+
+import numpy as np
+
+from data_processing.spatial_statistics.context import (
+    DISTANCE_TOLERANCE,
+    SpatialContext,
+    as_context,
+)
+from data_processing.spatial_statistics.pair_correlation import PAIR_STATISTICS
+
+NUM_STRATA = 4
+
+
+def get_strata(coords, num_strata=NUM_STRATA):
+    """Get the stratum of each cell, in a num_strata by num_strata grid over its bounding box"""
+    low = coords.min(axis=0)
+    extent = np.maximum(coords.max(axis=0) - low, 1e-12)
+    index = np.minimum((coords - low) / extent * num_strata, num_strata - 1).astype(np.int64)
+    return index[:, 0] * num_strata + index[:, 1]
+
+
+def stratified_sample(coords, budget, rng):
+    """Sample cells with an allocation proportional to the cells of each stratum
+
+    :param coords: the coordinates of the cells to sample from
+    :type coords: numpy.ndarray
+    :param budget: the number of cells to sample
+    :type budget: int
+    :param rng: the random generator
+    :type rng: numpy.random.Generator
+    :return: the index of each sampled cell, its stratum, and the number of cells
+        in the stratum divided by the number sampled from it
+    :rtype: tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+    """
+    strata = get_strata(coords)
+    indices = []
+    sample_strata = []
+    weights = []
+    for stratum in np.unique(strata):
+        members = np.flatnonzero(strata == stratum)
+        size = min(len(members), max(1, round(budget * len(members) / len(coords))))
+        indices.append(rng.choice(members, size, replace=False))
+        sample_strata.append(np.full(size, stratum))
+        weights.append(np.full(size, len(members) / size))
+    return np.concatenate(indices), np.concatenate(sample_strata), np.concatenate(weights)
+
+
+class FocalSampleContext(SpatialContext):
+    """Spatial context that estimates pair counts from a sample of focal cells
+
+    The count of pairs within a radius is the weighted sum of the neighbour
+    counts of the sampled cells of type 1, so CPCF and cross K estimates come
+    from the same functions as their exact values. The coordinates and
+    KD-trees are shared with the context of the whole sample.
+
+    :param ctx: the spatial context of the whole sample
+    :type ctx: SpatialContext
+    :param cell_type1: the cell type of the focal cells
+    :type cell_type1: str
+    :param focal: the index of each sampled focal cell among the cells of cell_type1
+    :type focal: numpy.ndarray
+    :param weights: the number of cells each sampled focal cell stands for
+    :type weights: numpy.ndarray
+    """
+
+    def __init__(self, ctx, cell_type1, focal, weights):
+        super().__init__(ctx.df, ctx.min_pair_radius)
+        self._coords = ctx._coords
+        self._trees = ctx._trees
+        self.cell_type1 = cell_type1
+        self.focal = focal
+        self.weights = weights
+        self._focal_counts = {}
+
+    def focal_counts(self, cell_type2, radii, inclusive):
+        """Get the number of cells of type 2 within each radius of each sampled focal cell"""
+        radii = np.asarray(radii, dtype=float)
+        key = (cell_type2, tuple(radii), inclusive)
+        if key not in self._focal_counts:
+            coords = self.coords(self.cell_type1)[self.focal]
+            tree = self.tree(cell_type2)
+            # Distances are compared with the same tolerance as SpatialContext.count_pairs
+            search_radii = radii + DISTANCE_TOLERANCE if inclusive else radii - DISTANCE_TOLERANCE
+            counts = np.zeros((len(coords), len(radii)), dtype=np.int64)
+            if self.count(cell_type2) > 0:
+                for i, radius in enumerate(search_radii):
+                    if radius >= 0:
+                        counts[:, i] = tree.query_ball_point(coords, radius, return_length=True)
+            if cell_type2 == self.cell_type1:
+                # A focal cell is within every non-negative radius of itself
+                counts -= (search_radii >= 0).astype(np.int64)
+            self._focal_counts[key] = counts
+        return self._focal_counts[key]
+
+    def count_pairs(self, cell_type1, cell_type2, radii, inclusive=True):
+        return self.weights @ self.focal_counts(cell_type2, radii, inclusive)
+
+    def with_weights(self, weights):
+        """Get a context sharing the neighbour counts of this one, with other focal weights"""
+        other = FocalSampleContext(self, self.cell_type1, self.focal, weights)
+        other._focal_counts = self._focal_counts
+        return other
+
+
+def get_interval(replicates, confidence):
+    """Get the percentile confidence interval of bootstrap replicates of a statistic"""
+    replicates = [r for r in replicates if r is not None]
+    if not replicates:
+        return None, None
+    alpha = (1 - confidence) / 2 * 100
+    replicates = np.asarray(replicates, dtype=float)
+    lower, upper = np.nanpercentile(replicates, [alpha, 100 - alpha], axis=0)
+    if np.ndim(lower) == 0:
+        return float(lower), float(upper)
+    return lower, upper
+
+
+def approximate_pair_statistic(ctx, func, params, budget, num_bootstrap, confidence, rng):
+    """Estimate a CPCF or cross K statistic from a stratified sample of focal cells
+
+    The bootstrap resamples the sampled focal cells with replacement within each stratum.
+    """
+    cell_type1 = params["cell_type1"]
+    focal, strata, weights = stratified_sample(ctx.coords(cell_type1), budget, rng)
+    sample_ctx = FocalSampleContext(ctx, cell_type1, focal, weights)
+    value = func(sample_ctx, **params)
+    members = [np.flatnonzero(strata == stratum) for stratum in np.unique(strata)]
+    replicates = []
+    for _ in range(num_bootstrap):
+        draws = np.concatenate([rng.choice(m, len(m), replace=True) for m in members])
+        multiplicity = np.bincount(draws, minlength=len(focal))
+        replicates.append(func(sample_ctx.with_weights(weights * multiplicity), **params))
+    return value, *get_interval(replicates, confidence)
+
+
+def approximate_subsampled_statistic(
+    ctx, func, params, budget, num_subsamples, num_bootstrap, confidence, rng
+):
+    """Estimate a statistic as its mean over stratified subsamples of all cells
+
+    The bootstrap resamples the subsample values with replacement, so the interval is of their mean.
+    """
+    values = []
+    for _ in range(num_subsamples):
+        index, _, _ = stratified_sample(ctx.coords(), budget, rng)
+        subsample = ctx.df.iloc[np.sort(index)].reset_index(drop=True)
+        values.append(func(SpatialContext(subsample), **params))
+    values = np.asarray([v for v in values if v is not None], dtype=float)
+    if len(values) == 0:
+        return None, None, None
+    value = np.nanmean(values, axis=0)
+    value = float(value) if np.ndim(value) == 0 else value
+    replicates = []
+    for _ in range(num_bootstrap):
+        draws = rng.integers(0, len(values), len(values))
+        replicates.append(np.nanmean(values[draws], axis=0))
+    return value, *get_interval(replicates, confidence)
+
+
+def approximate(
+    func, sample, params, budget, num_bootstrap=200, num_subsamples=10, confidence=0.95, seed=42
+):
+    """Calculate a statistic of at most budget cells, with a bootstrap confidence interval
+
+    Samples within the budget are calculated exactly, with an interval of the value itself.
+
+    :param func: the statistic function, taking a SpatialContext and parameters
+    :type func: Callable
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param params: the parameters of the statistic
+    :type params: dict
+    :param budget: the number of focal cells of pair statistics, or the number of cells
+        of the subsamples of other statistics
+    :type budget: int
+    :param num_bootstrap: the number of bootstrap replicates of the interval
+    :type num_bootstrap: int
+    :param num_subsamples: the number of subsamples of other statistics
+    :type num_subsamples: int
+    :param confidence: the confidence level of the interval
+    :type confidence: float
+    :param seed: the seed of the sampling
+    :type seed: int
+    :return: the value and the lower and upper bounds of its confidence interval
+    :rtype: tuple[Any, Any, Any]
+    """
+    ctx = as_context(sample)
+    rng = np.random.default_rng(seed)
+    if func in PAIR_STATISTICS:
+        if ctx.count(params["cell_type1"]) > budget:
+            return approximate_pair_statistic(
+                ctx, func, params, budget, num_bootstrap, confidence, rng
+            )
+    elif ctx.count() > budget:
+        return approximate_subsampled_statistic(
+            ctx, func, params, budget, num_subsamples, num_bootstrap, confidence, rng
+        )
+    value = func(ctx, **params)
+    return value, value, value
+
@@ -0,0 +1,259 @@
+"""Spatial structures of a sample shared across statistics
+
+A SpatialContext builds the coordinates, KD-tree, and neighbour searches of
+each cell type of a sample the first time a statistic asks for them and
+hands the same ones to every later statistic, instead of each statistic
+rebuilding them from the raw coordinates.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from data_processing.spatial_statistics.lattice import is_dense, lattice_pair_distances
+
+CELL_TYPES = ["sensitive", "resistant"]
+DISTANCE_TOLERANCE = 1e-9
+
+
+class SpatialContext:
+    """Lazily built and cached spatial structures of a single sample
+
+    :param df: the sample, with type, x, and y columns
+    :type df: Pandas DataFrame
+    :param min_pair_radius: the smallest radius to build pair histograms to,
+        so that statistics with different radii can share one histogram
+    :type min_pair_radius: float
+    """
+
+    def __init__(self, df, min_pair_radius=0):
+        self.df = df
+        self.min_pair_radius = min_pair_radius
+        self._coords = {}
+        self._trees = {}
+        self._nearest = {}
+        self._neighbour_counts = {}
+        self._pair_distances = {}
+        self._pair_histograms = {}
+        self._quadrat_counts = {}
+
+    def coords(self, cell_type=None):
+        """Get the x, y coordinates of the cells of a type, or of all cells, as floats"""
+        if cell_type not in self._coords:
+            df = self.df if cell_type is None else self.df[self.df["type"] == cell_type]
+            self._coords[cell_type] = df[["x", "y"]].to_numpy(dtype=float)
+        return self._coords[cell_type]
+
+    def count(self, cell_type=None):
+        """Get the number of cells of a type, or of all cells"""
+        return len(self.coords(cell_type))
+
+    def tree(self, cell_type=None):
+        """Get the KD-tree of the cells of a type, or of all cells"""
+        if cell_type not in self._trees:
+            self._trees[cell_type] = cKDTree(self.coords(cell_type))
+        return self._trees[cell_type]
+
+    @property
+    def on_lattice(self):
+        """Whether every cell is at integer coordinates"""
+        coords = self.coords()
+        return bool(np.all(coords == np.round(coords)))
+
+    @property
+    def area(self):
+        """The area of the bounding box of all cells, the default MuSpAn domain"""
+        coords = self.coords()
+        if len(coords) == 0:
+            return 0.0
+        width, height = coords.max(axis=0) - coords.min(axis=0)
+        return float(width * height)
+
+    def nearest_distances(self, cell_type1, cell_type2):
+        """Get the distance from each cell of type 1 to its nearest cell of type 2
+
+        A cell is not its own neighbour when the types are the same.
+
+        :return: the distances, or None if there are no such pairs of cells
+        :rtype: numpy.ndarray | None
+        """
+        key = (cell_type1, cell_type2)
+        if key not in self._nearest:
+            same = cell_type1 == cell_type2
+            if self.count(cell_type1) == 0 or self.count(cell_type2) < (2 if same else 1):
+                self._nearest[key] = None
+            else:
+                k = 2 if same else 1
+                distances, _ = self.tree(cell_type2).query(self.coords(cell_type1), k=k)
+                self._nearest[key] = distances[:, -1] if same else distances
+        return self._nearest[key]
+
+    def neighbour_counts(self, cell_type1, cell_type2, radius):
+        """Get the number of cells of type 2 within a radius of each cell of type 1
+
+        :param cell_type1: the cell type to count the neighbours of, or None for all cells
+        :type cell_type1: str | None
+        :param cell_type2: the cell type of the neighbours, or None for all cells
+        :type cell_type2: str | None
+        :param radius: the distance within which cells are neighbours, inclusive
+        :type radius: float
+        :return: the neighbour count of each cell of type 1, not counting itself
+        :rtype: numpy.ndarray
+        """
+        key = (cell_type1, cell_type2, radius)
+        if key not in self._neighbour_counts:
+            coords1 = self.coords(cell_type1)
+            if len(coords1) == 0 or self.count(cell_type2) == 0:
+                counts = np.zeros(len(coords1), dtype=int)
+            else:
+                counts = self.tree(cell_type2).query_ball_point(
+                    coords1, radius, return_length=True
+                )
+            if cell_type2 is None or cell_type1 == cell_type2:
+                counts = counts - 1
+            self._neighbour_counts[key] = np.asarray(counts)
+        return self._neighbour_counts[key]
+
+    def pair_distances(self, cell_type1, cell_type2, max_radius):
+        """Get the distances between every pair of cells of the two types within a radius
+
+        Pairs are searched for once per pair of types, at the largest radius
+        asked for so far, and filtered for smaller radii. The distances of
+        (type 1, type 2) and (type 2, type 1) are the same and share one search.
+
+        :param cell_type1: the first cell type
+        :type cell_type1: str
+        :param cell_type2: the second cell type
+        :type cell_type2: str
+        :param max_radius: the largest distance to keep, inclusive
+        :type max_radius: float
+        :return: the distance of each pair, sorted, not pairing a cell with itself
+        :rtype: numpy.ndarray
+        """
+        key = tuple(sorted([cell_type1, cell_type2]))
+        cached = self._pair_distances.get(key)
+        if cached is None or cached[0] < max_radius:
+            if self.count(key[0]) == 0 or self.count(key[1]) == 0:
+                distances = np.empty(0)
+            else:
+                pairs = self.tree(key[0]).sparse_distance_matrix(
+                    self.tree(key[1]), max_radius, output_type="ndarray"
+                )
+                if key[0] == key[1]:
+                    pairs = pairs[pairs["i"] != pairs["j"]]
+                distances = np.sort(pairs["v"])
+            cached = (max_radius, distances)
+            self._pair_distances[key] = cached
+        radius, distances = cached
+        if radius == max_radius:
+            return distances
+        return distances[: np.searchsorted(distances, max_radius, side="right")]
+
+    def pair_histogram(self, cell_type1, cell_type2, max_radius):
+        """Get the cumulative number of pairs of cells of the two types by distance
+
+        The histogram is built once per unordered pair of types, at the
+        largest radius asked for so far or min_pair_radius, and is shared
+        by every statistic of pair distances. Counting (type 1, type 2) pairs
+        gives the same histogram as (type 2, type 1), so both share one build.
+        Cells that fill enough of an integer lattice are counted with the FFT
+        lattice engine, others, including sparse cells at rounded coordinates,
+        with a KD-tree search.
+
+        :param cell_type1: the first cell type
+        :type cell_type1: str
+        :param cell_type2: the second cell type
+        :type cell_type2: str
+        :param max_radius: the largest distance the histogram needs to cover
+        :type max_radius: float
+        :return: each distance at which there are pairs, sorted, and the
+            number of pairs at that distance or closer
+        :rtype: tuple[numpy.ndarray, numpy.ndarray]
+        """
+        key = tuple(sorted([cell_type1, cell_type2]))
+        cached = self._pair_histograms.get(key)
+        if cached is None or cached[0] < max_radius:
+            radius = max(max_radius, self.min_pair_radius)
+            search_radius = radius + DISTANCE_TOLERANCE
+            coords1, coords2 = self.coords(key[0]), self.coords(key[1])
+            same = key[0] == key[1]
+            if self.on_lattice and is_dense(coords1, coords2, search_radius, same=same):
+                distances, counts = lattice_pair_distances(
+                    coords1, coords2, search_radius, same=same
+                )
+            else:
+                distances, counts = np.unique(
+                    self.pair_distances(key[0], key[1], search_radius), return_counts=True
+                )
+            cached = (radius, distances, np.cumsum(counts))
+            self._pair_histograms[key] = cached
+        return cached[1], cached[2]
+
+    def count_pairs(self, cell_type1, cell_type2, radii, inclusive=True):
+        """Count the pairs of cells of the two types within each radius
+
+        :param radii: the radii to count pairs within, sorted
+        :type radii: numpy.ndarray
+        :param inclusive: whether pairs at exactly a radius are within it
+        :type inclusive: bool
+        :return: the number of pairs within each radius
+        :rtype: numpy.ndarray
+        """
+        radii = np.asarray(radii, dtype=float)
+        distances, cumulative = self.pair_histogram(cell_type1, cell_type2, radii.max())
+        # Lattice samples have many pairs exactly at the radii, so distances are compared
+        # with a tolerance to count them the same whether they come from the lattice or a KD-tree
+        if inclusive:
+            index = np.searchsorted(distances, radii + DISTANCE_TOLERANCE, side="right")
+        else:
+            index = np.searchsorted(distances, radii - DISTANCE_TOLERANCE, side="left")
+        return np.concatenate([[0], cumulative])[index]
+
+    def quadrat_counts(self, side_length):
+        """Count the cells of each type in each square quadrat, in one bincount
+
+        Quadrats are laid out from the corner of the bounding box of all cells.
+
+        :param side_length: the side length of each quadrat
+        :type side_length: float
+        :return: the counts, indexed by quadrat x, quadrat y, and cell type in CELL_TYPES
+        :rtype: numpy.ndarray
+        """
+        if side_length not in self._quadrat_counts:
+            num_types = len(CELL_TYPES)
+            coords = self.coords()
+            if len(coords) == 0:
+                counts = np.zeros((0, 0, num_types), dtype=int)
+            else:
+                index = np.floor((coords - coords.min(axis=0)) / side_length).astype(np.int64)
+                shape = tuple(index.max(axis=0) + 1)
+                types = self.df["type"].map({t: i for i, t in enumerate(CELL_TYPES)})
+                known = types.notna().to_numpy()
+                flat = np.ravel_multi_index((index[known, 0], index[known, 1]), shape)
+                flat = flat * num_types + types[known].to_numpy(dtype=np.int64)
+                counts = np.bincount(flat, minlength=shape[0] * shape[1] * num_types)
+                counts = counts.reshape(shape + (num_types,))
+            self._quadrat_counts[side_length] = counts
+        return self._quadrat_counts[side_length]
+
+
+def as_context(sample):
+    """Get the spatial context of a sample, given either its context or its dataframe"""
+    if isinstance(sample, SpatialContext):
+        return sample
+    return SpatialContext(sample)
+
+
+class DataFrameStatistic:
+    """Adapt a statistic function of a sample dataframe to also take a SpatialContext
+
+    :param func: the statistic function, called with the dataframe and parameters
+    :type func: Callable
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = getattr(func, "__name__", type(func).__name__)
+        self.__doc__ = getattr(func, "__doc__", None)
+
+    def __call__(self, sample, **params):
+        return self.func(as_context(sample).df, **params)
@@ -0,0 +1,151 @@
+"""Pair distances of cells on an integer lattice, counted with an FFT
+
+ABM cells sit on lattice positions, so the number of pairs of cells at each
+offset (dx, dy) is the cross-correlation of the occupancy grids of the two
+cell types. One FFT convolution counts the pairs at every offset at once,
+in O(G log G) of the grid size G regardless of the number of cells, and the
+offsets are then binned by their distance.
+
+Processed in_silico_fit coordinates are lattice positions scaled by the
+grid_expansion of the ABM run, so the lattice spacing is inferred as the
+greatest common divisor of the coordinates unless it is given.
+"""
+
+import numpy as np
+from scipy import fft
+
+# The FFT's time and memory grow with the area of the grid rather than the number of cells, so it
+# is only used for grids with at most this many (padded) lattice positions per cell
+MAX_POSITIONS_PER_CELL = 256
+
+
+def get_spacing(coords):
+    """Get the lattice spacing of integer coordinates, 1 if they are not on a coarser lattice"""
+    coords = np.asarray(coords)
+    if len(coords) == 0 or not np.all(np.mod(coords, 1) == 0):
+        return 1
+    offsets = (coords - coords.min(axis=0)).astype(np.int64)
+    spacing = int(np.gcd.reduce(offsets.ravel()))
+    return max(spacing, 1)
+
+
+def get_grid(coords, max_radius, spacing=None):
+    """Get the lattice of a set of coordinates, covering their bounding box
+
+    :param coords: the x, y coordinates of the cells
+    :type coords: numpy.ndarray
+    :param max_radius: the largest distance to count pairs at
+    :type max_radius: float
+    :param spacing: the lattice spacing, defaults to inferring it from the coordinates
+    :type spacing: int, optional
+    :return: the spacing, the coordinates of lattice position (0, 0), the number of
+        lattice positions along x and y, and the largest offset to count pairs at
+    :rtype: tuple[int, numpy.ndarray, tuple[int, int], int]
+    """
+    if spacing is None:
+        spacing = get_spacing(coords)
+    origin = coords.min(axis=0)
+    shape = tuple(int(n) for n in np.rint((coords.max(axis=0) - origin) / spacing) + 1)
+    max_offset = int(np.floor(max_radius / spacing))
+    max_offset = min(max_offset, max(shape) - 1)
+    return spacing, origin, shape, max_offset
+
+
+def is_dense(coords1, coords2, max_radius, spacing=None, same=False):
+    """Whether cells fill enough of their lattice for counting pairs with an FFT to pay off
+
+    Sparse samples, such as cells at rounded coordinates of a whole stitched
+    image, are better searched with a KD-tree.
+
+    :param same: whether coords1 and coords2 are the same cells
+    :type same: bool
+    :return: whether the padded grid has at most MAX_POSITIONS_PER_CELL positions per cell
+    :rtype: bool
+    """
+    all_coords = coords1 if same else np.concatenate([coords1, coords2])
+    if len(all_coords) == 0:
+        return False
+    _, _, shape, max_offset = get_grid(all_coords, max_radius, spacing)
+    size = (shape[0] + max_offset) * (shape[1] + max_offset)
+    return size <= MAX_POSITIONS_PER_CELL * len(all_coords)
+
+
+def rasterize(coords, origin, shape, spacing):
+    """Count the cells at each lattice position
+
+    :param coords: the x, y coordinates of the cells
+    :type coords: numpy.ndarray
+    :param origin: the coordinates of lattice position (0, 0)
+    :type origin: numpy.ndarray
+    :param shape: the number of lattice positions along x and y
+    :type shape: tuple[int, int]
+    :param spacing: the distance between neighbouring lattice positions
+    :type spacing: int
+    :return: the occupancy grid, indexed by x then y
+    :rtype: numpy.ndarray
+    """
+    index = np.rint((np.asarray(coords) - origin) / spacing).astype(np.int64)
+    flat = np.ravel_multi_index((index[:, 0], index[:, 1]), shape)
+    return np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape).astype(float)
+
+
+def offset_counts(grid1, grid2, max_offset):
+    """Count the pairs of cells at each offset up to max_offset along each axis
+
+    :param grid1: the occupancy grid of the first cell type
+    :type grid1: numpy.ndarray
+    :param grid2: the occupancy grid of the second cell type
+    :type grid2: numpy.ndarray
+    :param max_offset: the largest offset to count, in lattice positions
+    :type max_offset: int
+    :return: the number of (cell 1, cell 2) pairs where cell 2 is at cell 1 + (dx, dy),
+        indexed by dx + max_offset, dy + max_offset
+    :rtype: numpy.ndarray
+    """
+    # Padding by max_offset keeps the circular correlation from wrapping around
+    shape = (grid1.shape[0] + max_offset, grid1.shape[1] + max_offset)
+    shape = tuple(fft.next_fast_len(n, real=True) for n in shape)
+    transform1 = fft.rfft2(grid1, s=shape)
+    transform2 = fft.rfft2(grid2, s=shape)
+    correlation = fft.irfft2(np.conj(transform1) * transform2, s=shape)
+    x_index = np.arange(-max_offset, max_offset + 1) % shape[0]
+    y_index = np.arange(-max_offset, max_offset + 1) % shape[1]
+    return np.rint(correlation[np.ix_(x_index, y_index)])
+
+
+def lattice_pair_distances(coords1, coords2, max_radius, spacing=None, same=False):
+    """Get the distances between pairs of cells on a lattice and how many pairs are at each
+
+    :param coords1: the x, y coordinates of the first cell type
+    :type coords1: numpy.ndarray
+    :param coords2: the x, y coordinates of the second cell type
+    :type coords2: numpy.ndarray
+    :param max_radius: the largest distance to count pairs at, inclusive
+    :type max_radius: float
+    :param spacing: the lattice spacing, defaults to inferring it from the coordinates
+    :type spacing: int, optional
+    :param same: whether coords1 and coords2 are the same cells,
+        in which case a cell is not paired with itself
+    :type same: bool
+    :return: each distance at which there are pairs, sorted, and the number of pairs at it
+    :rtype: tuple[numpy.ndarray, numpy.ndarray]
+    """
+    if len(coords1) == 0 or len(coords2) == 0:
+        return np.empty(0), np.empty(0)
+    all_coords = np.concatenate([coords1, coords2])
+    spacing, origin, shape, max_offset = get_grid(all_coords, max_radius, spacing)
+
+    grid1 = rasterize(coords1, origin, shape, spacing)
+    grid2 = grid1 if same else rasterize(coords2, origin, shape, spacing)
+    counts = offset_counts(grid1, grid2, max_offset)
+    if same:
+        # Cells at the same position pair with each other, but not with themselves
+        counts[max_offset, max_offset] -= len(coords1)
+
+    # Bin the offsets by their squared distance, which is an integer on the lattice
+    offsets = np.arange(-max_offset, max_offset + 1)
+    squared = offsets[:, None] ** 2 + offsets[None, :] ** 2
+    in_range = squared * spacing**2 <= max_radius**2
+    pairs = np.bincount(squared[in_range], weights=counts[in_range])
+    squared_distances = np.flatnonzero(pairs)
+    return spacing * np.sqrt(squared_distances), pairs[squared_distances]
@@ -0,0 +1,48 @@
+"""Nearest neighbour statistics computed with a KD-tree
+
+Native counterparts of the MuSpAn nearest neighbour statistics,
+which build a MuSpAn domain and query on every call.
+"""
+
+import numpy as np
+
+from data_processing.spatial_statistics.context import as_context
+
+
+def nn_dist(sample, cell_type1, cell_type2):
+    """Distribution of distances from each cell of type 1 to its nearest cell of type 2
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param cell_type1: the cell type to get the distances of
+    :type cell_type1: str
+    :param cell_type2: the cell type of the neighbours
+    :type cell_type2: str
+    :return: the nearest neighbour distances, or None if a cell type is missing
+    :rtype: numpy.ndarray | None
+    """
+    return as_context(sample).nearest_distances(cell_type1, cell_type2)
+
+
+def anni(sample, cell_type1, cell_type2):
+    """Average nearest neighbour index of cells of type 1 to cells of type 2
+
+    The mean nearest neighbour distance divided by the mean expected
+    if cells of type 2 were randomly distributed over the bounding box,
+    0.5 * sqrt(area / number of cells of type 2).
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param cell_type1: the cell type to get the distances of
+    :type cell_type1: str
+    :param cell_type2: the cell type of the neighbours
+    :type cell_type2: str
+    :return: the index, or None if a cell type is missing
+    :rtype: float | None
+    """
+    ctx = as_context(sample)
+    distances = ctx.nearest_distances(cell_type1, cell_type2)
+    if distances is None:
+        return None
+    expected = 0.5 * np.sqrt(ctx.area / ctx.count(cell_type2))
+    return float(distances.mean() / expected)
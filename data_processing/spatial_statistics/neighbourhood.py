@@ -0,0 +1,47 @@
+"""Cell type composition of a sample and of the neighbourhood of its cells"""
+
+from data_processing.spatial_statistics.context import as_context
+
+
+def proportion_cell(sample, cell_type):
+    """Proportion of the cells of a sample that are of a cell type
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param cell_type: the cell type
+    :type cell_type: str
+    :return: the proportion, or None if there are no cells
+    :rtype: float | None
+    """
+    ctx = as_context(sample)
+    total = ctx.count()
+    if total == 0:
+        return None
+    return ctx.count(cell_type) / total
+
+
+def nc_dist(sample, radius, return_fs):
+    """Distribution of the composition of the neighbourhood of each cell of one type
+
+    With return_fs, the fraction of sensitive cells among the neighbours of
+    each resistant cell, otherwise the fraction of resistant cells among the
+    neighbours of each sensitive cell. Cells without neighbours are left out.
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param radius: the distance within which cells are neighbours, inclusive
+    :type radius: float
+    :param return_fs: whether to get the fraction sensitive around resistant cells
+    :type return_fs: bool
+    :return: the fraction of each cell's neighbours that are of the other type,
+        or None if no cell has neighbours
+    :rtype: numpy.ndarray | None
+    """
+    ctx = as_context(sample)
+    cell_type1, cell_type2 = ("resistant", "sensitive") if return_fs else ("sensitive", "resistant")
+    num_neighbours = ctx.neighbour_counts(cell_type1, None, radius)
+    num_other = ctx.neighbour_counts(cell_type1, cell_type2, radius)
+    has_neighbours = num_neighbours > 0
+    if not has_neighbours.any():
+        return None
+    return num_other[has_neighbours] / num_neighbours[has_neighbours]
@@ -0,0 +1,95 @@
+"""Cross pair correlation function and cross Ripley's K from pair distances
+
+Both are normalisations of the same histogram of pair distances, which the
+SpatialContext of a sample builds once per pair of cell types and shares
+between every CPCF and K statistic, in either order of the cell types.
+Both are normalised by the area of the bounding box of all cells, without
+MuSpAn's edge correction, so they are an opt-in backend (see
+STATISTIC_BACKENDS in spatial_database.py) until compared with spatial_egt.
+"""
+
+import numpy as np
+
+from data_processing.spatial_statistics.context import as_context
+
+
+def get_pair_radius(params):
+    """Get the largest pair distance a CPCF or cross K statistic needs, from its parameters"""
+    if "annulus_width" in params:
+        return params["max_radius"] + params["annulus_width"] / 2
+    return params["max_radius"]
+
+
+def get_intensity(ctx, cell_type1, cell_type2):
+    """Get the number of pairs of the two cell types per unit area, or None if there are none"""
+    num_cells1 = ctx.count(cell_type1)
+    num_cells2 = ctx.count(cell_type2) - (1 if cell_type1 == cell_type2 else 0)
+    if num_cells1 == 0 or num_cells2 <= 0 or ctx.area == 0:
+        return None
+    return num_cells1 * num_cells2 / ctx.area
+
+
+def cpcf(sample, max_radius, annulus_step, annulus_width, cell_type1, cell_type2):
+    """Cross pair correlation function of cell type 1 to cell type 2
+
+    The pairs in the annulus of width annulus_width centered on each radius
+    from 0 to max_radius in steps of annulus_step, divided by the number
+    expected under complete spatial randomness.
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param max_radius: the largest annulus radius
+    :type max_radius: float
+    :param annulus_step: the distance between annulus radii
+    :type annulus_step: float
+    :param annulus_width: the width of each annulus
+    :type annulus_width: float
+    :param cell_type1: the first cell type
+    :type cell_type1: str
+    :param cell_type2: the second cell type
+    :type cell_type2: str
+    :return: the pair correlation at each radius, or None if a cell type is missing
+    :rtype: numpy.ndarray | None
+    """
+    ctx = as_context(sample)
+    intensity = get_intensity(ctx, cell_type1, cell_type2)
+    if intensity is None:
+        return None
+    radii = np.arange(0, max_radius + annulus_step / 2, annulus_step)
+    inner = np.maximum(radii - annulus_width / 2, 0)
+    outer = radii + annulus_width / 2
+    within_outer = ctx.count_pairs(cell_type1, cell_type2, outer, inclusive=False)
+    within_inner = ctx.count_pairs(cell_type1, cell_type2, inner, inclusive=False)
+    in_annulus = within_outer - within_inner
+    annulus_area = np.pi * (outer**2 - inner**2)
+    return in_annulus / (intensity * annulus_area)
+
+
+def cross_k(sample, max_radius, step, cell_type1, cell_type2):
+    """Cross Ripley's K function of cell type 1 to cell type 2
+
+    The area times the number of pairs within each radius from 0 to
+    max_radius in steps of step, divided by the number of pairs.
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param max_radius: the largest radius
+    :type max_radius: float
+    :param step: the distance between radii
+    :type step: float
+    :param cell_type1: the first cell type
+    :type cell_type1: str
+    :param cell_type2: the second cell type
+    :type cell_type2: str
+    :return: K at each radius, or None if a cell type is missing
+    :rtype: numpy.ndarray | None
+    """
+    ctx = as_context(sample)
+    intensity = get_intensity(ctx, cell_type1, cell_type2)
+    if intensity is None:
+        return None
+    radii = np.arange(0, max_radius + step / 2, step)
+    return ctx.count_pairs(cell_type1, cell_type2, radii) / intensity
+
+
+PAIR_STATISTICS = [cpcf, cross_k]
@@ -0,0 +1,177 @@
+"""Quadrat statistics computed from one shared count grid
+
+The sample is binned into square quadrats once per side length, counting
+the cells of each type in each quadrat with a single bincount, and the
+SpatialContext of the sample shares the counts with every quadrat statistic.
+Quadrats are laid out from the corner of the bounding box of all cells.
+"""
+
+import numpy as np
+
+from data_processing.spatial_statistics.context import CELL_TYPES, as_context
+
+
+def _neighbour_sums(values):
+    """Sum the values of the rook neighbours (up, down, left, right) of each quadrat"""
+    sums = np.zeros_like(values, dtype=float)
+    sums[1:, :] += values[:-1, :]
+    sums[:-1, :] += values[1:, :]
+    sums[:, 1:] += values[:, :-1]
+    sums[:, :-1] += values[:, 1:]
+    return sums
+
+
+def _num_neighbour_pairs(shape):
+    """Get the number of ordered rook neighbour pairs of quadrats on a grid, the sum of weights"""
+    nx, ny = shape
+    return 2 * ((nx - 1) * ny + nx * (ny - 1))
+
+
+def _type_counts(ctx, cell_type, side_length):
+    counts = ctx.quadrat_counts(side_length)
+    return counts[:, :, CELL_TYPES.index(cell_type)].astype(float)
+
+
+def global_moransi(sample, cell_type, side_length):
+    """Global Moran's I of the counts of a cell type in each quadrat
+
+    Uses binary rook contiguity weights between quadrats.
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param cell_type: the cell type to count
+    :type cell_type: str
+    :param side_length: the side length of each square quadrat
+    :type side_length: float
+    :return: Moran's I, or None if the counts do not vary or there is one quadrat
+    :rtype: float | None
+    """
+    counts = _type_counts(as_context(sample), cell_type, side_length)
+    z = counts - counts.mean()
+    variance = (z**2).sum()
+    num_weights = _num_neighbour_pairs(counts.shape)
+    if variance == 0 or num_weights == 0:
+        return None
+    return float(counts.size / num_weights * (z * _neighbour_sums(z)).sum() / variance)
+
+
+def local_moransi_dist(sample, cell_type, side_length):
+    """Distribution of the local Moran's I of the counts of a cell type in each quadrat
+
+    Uses binary rook contiguity weights between quadrats.
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param cell_type: the cell type to count
+    :type cell_type: str
+    :param side_length: the side length of each square quadrat
+    :type side_length: float
+    :return: the local Moran's I of each quadrat, or None if the counts do not vary
+    :rtype: numpy.ndarray | None
+    """
+    counts = _type_counts(as_context(sample), cell_type, side_length)
+    z = counts - counts.mean()
+    variance = (z**2).mean()
+    if variance == 0:
+        return None
+    return (z * _neighbour_sums(z) / variance).ravel()
+
+
+def qcm(sample, side_length, num_permutations=1000, seed=42):
+    """Standardized effect size of the quadrat correlation of sensitive and resistant cells
+
+    The correlation between the counts of the two cell types across quadrats,
+    compared to its distribution when the cell types are randomly permuted
+    among the cells, which keeps the number of cells in each quadrat.
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param side_length: the side length of each square quadrat
+    :type side_length: float
+    :param num_permutations: the number of permutations in the null distribution
+    :type num_permutations: int
+    :param seed: the seed of the permutations
+    :type seed: int
+    :return: the standardized effect size, or None if it is undefined
+    :rtype: float | None
+    """
+    ctx = as_context(sample)
+    counts = ctx.quadrat_counts(side_length).reshape(-1, len(CELL_TYPES))
+    totals = counts.sum(axis=1)
+    occupied = totals > 0
+    counts = counts[occupied]
+    totals = totals[occupied]
+    resistant = CELL_TYPES.index("resistant")
+    num_resistant = int(counts[:, resistant].sum())
+    if len(totals) < 2 or num_resistant == 0 or num_resistant == totals.sum():
+        return None
+
+    def correlation(resistant):
+        # Sensitive counts are the totals minus the resistant counts
+        return _row_correlation(totals - resistant, resistant)
+
+    observed = correlation(counts[:, resistant][None, :])[0]
+    # Drawing each quadrat's resistant count as if the labels were shuffled
+    # is a multivariate hypergeometric draw over the quadrats
+    rng = np.random.default_rng(seed)
+    null_counts = rng.multivariate_hypergeometric(totals, num_resistant, size=num_permutations)
+    null = correlation(null_counts)
+    null = null[np.isfinite(null)]
+    if len(null) < 2 or null.std() == 0 or not np.isfinite(observed):
+        return None
+    return float((observed - null.mean()) / null.std())
+
+
+def _row_correlation(a, b):
+    """Get the Pearson correlation of each row of a with the same row of b"""
+    a = a - a.mean(axis=1, keepdims=True)
+    b = b - b.mean(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (a * b).sum(axis=1) / np.sqrt((a**2).sum(axis=1) * (b**2).sum(axis=1))
+
+
+def entropy(sample, side_length=100):
+    """Mean Shannon entropy of the cell type composition of the occupied quadrats
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param side_length: the side length of each square quadrat
+    :type side_length: float
+    :return: the mean entropy in bits, or None if there are no cells
+    :rtype: float | None
+    """
+    counts = as_context(sample).quadrat_counts(side_length).reshape(-1, len(CELL_TYPES))
+    totals = counts.sum(axis=1)
+    counts = counts[totals > 0]
+    if len(counts) == 0:
+        return None
+    proportions = counts / counts.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(proportions > 0, proportions * np.log2(proportions), 0)
+    return float(-terms.sum(axis=1).mean())
+
+
+def kl_divergence(sample, mesh_step, epsilon=1e-10):
+    """KL divergence of the distribution of sensitive cells from that of resistant cells
+
+    Each distribution is the proportion of the cells of a type in each quadrat
+    of side length mesh_step, smoothed by epsilon so empty quadrats are defined.
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param mesh_step: the side length of each square quadrat
+    :type mesh_step: float
+    :param epsilon: the probability added to each quadrat before normalising
+    :type epsilon: float
+    :return: the KL divergence in bits, or None if a cell type is missing
+    :rtype: float | None
+    """
+    counts = as_context(sample).quadrat_counts(mesh_step).reshape(-1, len(CELL_TYPES))
+    totals = counts.sum(axis=0)
+    if np.any(totals == 0):
+        return None
+    distributions = counts / totals + epsilon
+    distributions = distributions / distributions.sum(axis=0)
+    sensitive = distributions[:, CELL_TYPES.index("sensitive")]
+    resistant = distributions[:, CELL_TYPES.index("resistant")]
+    return float((sensitive * np.log2(sensitive / resistant)).sum())
@@ -0,0 +1,127 @@
+"""Wasserstein distance between the sensitive and resistant cells of a sample
+
+The distance is the earth mover's distance (W1, Euclidean ground cost)
+between the uniform distributions over the sensitive and resistant cells.
+The method is chosen through STATISTIC_PARAMS["Wasserstein"]["method"]:
+
+exact: network simplex (POT) on the full cost matrix between cells. The
+    reference value, but the cost matrix takes n_sensitive * n_resistant memory
+    and solving it grows roughly cubically, so it is only practical up to a few
+    thousand cells of each type.
+histogram: cells are binned into squares of side grid_size and the exact
+    distance is solved between the bin masses at the bin centers. Moving each
+    cell to its bin center moves it at most half a bin diagonal, so the value is
+    within grid_size * sqrt(2) of the exact value. The cost depends on the
+    number of occupied bins instead of cells, so it suits dense samples.
+sinkhorn: entropic regularized transport (POT, log-domain Sinkhorn) between
+    the same bin masses, with reg relative to the largest bin distance. Each
+    iteration is a matrix product, so it is faster than histogram when there
+    are many occupied bins, but the entropic plan spreads mass, biasing the
+    value upward by an amount that grows with reg.
+sliced: the mean of the 1D distances of the cells projected onto
+    num_projections random directions, which only needs sorting, so it scales
+    to any number of cells. It is a different metric, smaller than W1 (by about
+    2/pi for a displacement in a random direction), so it ranks samples like
+    W1 but is not an estimate of its value.
+"""
+
+import numpy as np
+import ot
+from scipy.spatial.distance import cdist
+from scipy.stats import wasserstein_distance
+
+from data_processing.spatial_statistics.context import as_context
+
+
+def exact_wasserstein(coords1, coords2):
+    """Exact W1 distance between the uniform distributions over two sets of points"""
+    weights1 = np.full(len(coords1), 1 / len(coords1))
+    weights2 = np.full(len(coords2), 1 / len(coords2))
+    return float(ot.emd2(weights1, weights2, cdist(coords1, coords2)))
+
+
+def get_bin_masses(coords1, coords2, grid_size):
+    """Bin two sets of points into shared square bins
+
+    :return: the center of each occupied bin of each set and the fraction of its points in it
+    :rtype: tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]
+    """
+    origin = np.minimum(coords1.min(axis=0), coords2.min(axis=0))
+    binned = []
+    for coords in (coords1, coords2):
+        index = np.floor((coords - origin) / grid_size).astype(np.int64)
+        bins, counts = np.unique(index, axis=0, return_counts=True)
+        binned.append(((bins + 0.5) * grid_size + origin, counts / len(coords)))
+    (centers1, masses1), (centers2, masses2) = binned
+    return centers1, masses1, centers2, masses2
+
+
+def histogram_wasserstein(coords1, coords2, grid_size=10):
+    """Exact W1 distance between the masses of two sets of points in square bins"""
+    centers1, masses1, centers2, masses2 = get_bin_masses(coords1, coords2, grid_size)
+    return float(ot.emd2(masses1, masses2, cdist(centers1, centers2)))
+
+
+def sinkhorn_wasserstein(coords1, coords2, grid_size=10, reg=0.01, num_iterations=1000):
+    """Entropic regularized transport cost between the masses of two sets of points in square bins
+
+    :param reg: the entropic regularization, relative to the largest distance between bins
+    :type reg: float
+    :param num_iterations: the largest number of Sinkhorn iterations
+    :type num_iterations: int
+    """
+    centers1, masses1, centers2, masses2 = get_bin_masses(coords1, coords2, grid_size)
+    costs = cdist(centers1, centers2)
+    scale = costs.max()
+    if scale == 0:
+        return 0.0
+    plan = ot.sinkhorn(
+        masses1, masses2, costs / scale, reg, method="sinkhorn_log", numItermax=num_iterations
+    )
+    return float((plan * costs).sum())
+
+
+def sliced_wasserstein(coords1, coords2, num_projections=100, seed=42):
+    """Mean 1D W1 distance between two sets of points projected onto random directions"""
+    rng = np.random.default_rng(seed)
+    angles = rng.uniform(0, np.pi, num_projections)
+    directions = np.column_stack([np.cos(angles), np.sin(angles)])
+    projected1 = coords1 @ directions.T
+    projected2 = coords2 @ directions.T
+    return float(
+        np.mean(
+            [
+                wasserstein_distance(projected1[:, i], projected2[:, i])
+                for i in range(num_projections)
+            ]
+        )
+    )
+
+
+WASSERSTEIN_METHODS = {
+    "exact": exact_wasserstein,
+    "histogram": histogram_wasserstein,
+    "sinkhorn": sinkhorn_wasserstein,
+    "sliced": sliced_wasserstein,
+}
+
+
+def wasserstein(sample, method="exact", **options):
+    """Wasserstein distance between the sensitive and resistant cells
+
+    :param sample: the sample, with type, x, and y columns, or its spatial context
+    :type sample: Pandas DataFrame | SpatialContext
+    :param method: exact, histogram, sinkhorn, or sliced
+    :type method: str
+    :param options: the keyword arguments of the method, such as grid_size
+    :return: the distance, or None if a cell type is missing
+    :rtype: float | None
+    """
+    if method not in WASSERSTEIN_METHODS:
+        raise ValueError(
+            f"Unknown Wasserstein method {method}, must be in {list(WASSERSTEIN_METHODS)}"
+        )
+    ctx = as_context(sample)
+    if ctx.count("sensitive") == 0 or ctx.count("resistant") == 0:
+        return None
+    return WASSERSTEIN_METHODS[method](ctx.coords("sensitive"), ctx.coords("resistant"), **options)
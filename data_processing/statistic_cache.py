@@ -0,0 +1,242 @@
+"""Persistent cache of statistic values of processed samples
+
+Values are keyed by the hash of the sample contents, the statistic name, and
+its parameters, so changing one statistic's parameters or adding a data
+directory only calculates what is new. The cache is an SQLite database
+bounded in size, evicting the least recently used values first.
+
+Expected usage:
+python3 -m data_processing.statistic_cache command (-path cache_path) (-max_size max_size)
+    (-stat statistic)
+
+Where:
+command: info to summarize the cache, prune to evict values until it is within max_size,
+    or clear to remove the values of a statistic, or all values
+cache_path: optional, the path to the cache, defaults to data/statistic_cache.sqlite
+max_size: optional, the size to prune the cache to in MB
+statistic: optional, the statistic to clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+
+import numpy as np
+
+from data_processing.processed_samples import get_sidecar_path, load_processed_array
+
+DEFAULT_CACHE_PATH = "data/statistic_cache.sqlite"
+DEFAULT_MAX_SIZE = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    hash TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    sample_hash TEXT NOT NULL,
+    statistic TEXT NOT NULL,
+    params TEXT NOT NULL,
+    value BLOB,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (sample_hash, statistic, params)
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+"""
+
+
+def get_params_key(params):
+    """Get the key of a statistic's parameters, the same regardless of their order"""
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class StatisticCache:
+    """Size-bounded least recently used cache of statistic values
+
+    :param path: the path to the SQLite database
+    :type path: str
+    :param max_size: the size the cached values are kept within, in MB
+    :type max_size: float
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def hash_sample(self, sample_path):
+        """Get the hash of the contents of a processed sample
+
+        The hash is of the sample as a structured array, so it is the same
+        whether the sample is saved as csv or npy. It is only recalculated
+        when the size or modification time of the file it is loaded from,
+        the sidecar if there is one and otherwise the csv, changes.
+
+        :param sample_path: the csv path of the processed sample
+        :type sample_path: str
+        :return: the SHA-256 of the sample
+        :rtype: str
+        """
+        loaded_path = get_sidecar_path(sample_path)
+        if not os.path.exists(loaded_path):
+            loaded_path = sample_path
+        stat = os.stat(loaded_path)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, hash FROM samples WHERE path = ?", (loaded_path,)
+        ).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        sample = np.ascontiguousarray(load_processed_array(sample_path))
+        sample_hash = hashlib.sha256(sample.tobytes()).hexdigest()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)",
+                (loaded_path, stat.st_size, stat.st_mtime_ns, sample_hash),
+            )
+        return sample_hash
+
+    def get(self, sample_hash, statistic, params):
+        """Get a cached value, marking it as recently used
+
+        :return: whether the value was cached, and the value
+        :rtype: tuple[bool, Any]
+        """
+        params_key = get_params_key(params)
+        row = self.conn.execute(
+            "SELECT value FROM results WHERE sample_hash = ? AND statistic = ? AND params = ?",
+            (sample_hash, statistic, params_key),
+        ).fetchone()
+        if row is None:
+            return False, None
+        with self.conn:
+            self.conn.execute(
+                "UPDATE results SET last_used = ? "
+                "WHERE sample_hash = ? AND statistic = ? AND params = ?",
+                (time.time(), sample_hash, statistic, params_key),
+            )
+        return True, pickle.loads(row[0])
+
+    def get_many(self, sample_hash, statistic_params):
+        """Get the cached values of several statistics of a sample in one query
+
+        :param sample_hash: the hash of the sample
+        :type sample_hash: str
+        :param statistic_params: the parameters of each statistic to look up
+        :type statistic_params: dict[str, dict]
+        :return: the value of each statistic that was cached
+        :rtype: dict[str, Any]
+        """
+        keys = {(name, get_params_key(params)) for name, params in statistic_params.items()}
+        rows = self.conn.execute(
+            "SELECT statistic, params, value FROM results WHERE sample_hash = ?", (sample_hash,)
+        ).fetchall()
+        found = {(name, params): value for name, params, value in rows if (name, params) in keys}
+        if found:
+            now = time.time()
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE results SET last_used = ? "
+                    "WHERE sample_hash = ? AND statistic = ? AND params = ?",
+                    [(now, sample_hash, name, params) for name, params in found],
+                )
+        return {name: pickle.loads(value) for (name, _), value in found.items()}
+
+    def put_many(self, entries):
+        """Cache values, then evict the least recently used values beyond the maximum size
+
+        :param entries: the sample hash, statistic name, parameters, and value of each entry
+        :type entries: list[tuple[str, str, dict, Any]]
+        """
+        now = time.time()
+        rows = []
+        for sample_hash, statistic, params, value in entries:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((sample_hash, statistic, get_params_key(params), blob, len(blob), now))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.prune(self.max_size)
+
+    def put(self, sample_hash, statistic, params, value):
+        self.put_many([(sample_hash, statistic, params, value)])
+
+    def size(self):
+        """Get the total size of the cached values in bytes"""
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def prune(self, max_size):
+        """Evict the least recently used values until the cache is within max_size MB
+
+        :return: the number of values evicted
+        :rtype: int
+        """
+        excess = self.size() - max_size * 2**20
+        if excess <= 0:
+            return 0
+        evicted = 0
+        with self.conn:
+            rows = self.conn.execute(
+                "SELECT rowid, size FROM results ORDER BY last_used"
+            ).fetchall()
+            for rowid, size in rows:
+                if excess <= 0:
+                    break
+                self.conn.execute("DELETE FROM results WHERE rowid = ?", (rowid,))
+                excess -= size
+                evicted += 1
+        return evicted
+
+    def clear(self, statistic=None):
+        """Remove the cached values of a statistic, or all cached values"""
+        with self.conn:
+            if statistic is None:
+                self.conn.execute("DELETE FROM results")
+            else:
+                self.conn.execute("DELETE FROM results WHERE statistic = ?", (statistic,))
+        self.conn.execute("VACUUM")
+
+    def summary(self):
+        """Get the number and size of the cached values of each statistic"""
+        return self.conn.execute(
+            "SELECT statistic, COUNT(*), SUM(size), MAX(last_used) "
+            "FROM results GROUP BY statistic ORDER BY statistic"
+        ).fetchall()
+
+
+def main():
+    """Inspect or prune the statistic cache"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["info", "prune", "clear"])
+    parser.add_argument("-path", "--cache_path", type=str, default=DEFAULT_CACHE_PATH)
+    parser.add_argument("-max_size", "--max_size", type=float, default=DEFAULT_MAX_SIZE)
+    parser.add_argument("-stat", "--statistic", type=str, default=None)
+    args = parser.parse_args()
+
+    cache = StatisticCache(args.cache_path, args.max_size)
+    if args.command == "prune":
+        print(f"Evicted {cache.prune(args.max_size)} values")
+    elif args.command == "clear":
+        cache.clear(args.statistic)
+    summary = cache.summary()
+    for statistic, count, size, last_used in summary:
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used))
+        print(f"{statistic}: {count} values, {size / 2**20:.1f} MB, last used {last_used}")
+    print(f"Total: {sum(row[1] for row in summary)} values, {cache.size() / 2**20:.1f} MB")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,11 @@
+from data_processing.spatial_statistics import (
+    nearest_neighbour,
+    neighbourhood,
+    pair_correlation,
+    quadrats,
+    transport,
+)
+from data_processing.spatial_statistics.context import DataFrameStatistic
 from spatial_egt.data_processing.spatial_statistics.custom import (
     nc_dist,
     proportion_cell
@@ -15,7 +23,19 @@ from spatial_egt.data_processing.spatial_statistics.muspan_statistics import (
     wasserstein,
 )
 
-STATISTIC_REGISTRY = {
+
+def spatial_egt_wasserstein(df, method="exact", **options):
+    """The spatial_egt Wasserstein distance, or an approximation of it with another method
+
+    :param method: exact for the spatial_egt distance, or a method of transport.wasserstein
+    :type method: str
+    """
+    if method == "exact":
+        return wasserstein(df)
+    return transport.wasserstein(df, method, **options)
+
+
+SPATIAL_EGT_STATISTICS = {
     # Custom
     "NC_RS": nc_dist,
     "NC_SR": nc_dist,
@@ -40,9 +60,77 @@ STATISTIC_REGISTRY = {
     "NN_RS": nn_dist,
     "NN_SR": nn_dist,
     "SES": qcm,
-    "Wasserstein": wasserstein,
+    "Wasserstein": spatial_egt_wasserstein,
+}
+
+NATIVE_STATISTICS = {
+    "NC_RS": neighbourhood.nc_dist,
+    "NC_SR": neighbourhood.nc_dist,
+    "Proportion_Sensitive": neighbourhood.proportion_cell,
+    "ANNI_RS": nearest_neighbour.anni,
+    "ANNI_SR": nearest_neighbour.anni,
+    "CPCF_RR": pair_correlation.cpcf,
+    "CPCF_RS": pair_correlation.cpcf,
+    "CPCF_SR": pair_correlation.cpcf,
+    "CPCF_SS": pair_correlation.cpcf,
+    "Ripleys_k_RR": pair_correlation.cross_k,
+    "Ripleys_k_RS": pair_correlation.cross_k,
+    "Ripleys_k_SR": pair_correlation.cross_k,
+    "Ripleys_k_SS": pair_correlation.cross_k,
+    "Entropy": quadrats.entropy,
+    "Global_i_Resistant": quadrats.global_moransi,
+    "Global_i_Sensitive": quadrats.global_moransi,
+    "KL_Divergence": quadrats.kl_divergence,
+    "Local_i_Resistant": quadrats.local_moransi_dist,
+    "Local_i_Sensitive": quadrats.local_moransi_dist,
+    "NN_RS": nearest_neighbour.nn_dist,
+    "NN_SR": nearest_neighbour.nn_dist,
+    "SES": quadrats.qcm,
+    "Wasserstein": transport.wasserstein,
+}
+
+# The native backend of a statistic is opt-in until benchmarks.compare_backends shows it agrees
+# with spatial_egt, set a statistic to "native" here to use it
+STATISTIC_BACKENDS = {
+    "Proportion_Sensitive": "native",
 }
 
+# Statistics calculated within a compute budget, with a confidence interval, in approximate mode
+APPROXIMATE_STATISTICS = [
+    "CPCF_RR",
+    "CPCF_RS",
+    "CPCF_SR",
+    "CPCF_SS",
+    "Ripleys_k_RR",
+    "Ripleys_k_RS",
+    "Ripleys_k_SR",
+    "Ripleys_k_SS",
+    "Wasserstein",
+]
+
+
+def get_statistic(name, backend=None):
+    """Get the function that computes a statistic
+
+    :param name: the name of the statistic
+    :type name: str
+    :param backend: native or spatial_egt, defaults to the backend in STATISTIC_BACKENDS,
+        or spatial_egt if the statistic has no entry
+    :type backend: str, optional
+    :return: the statistic function, taking a sample dataframe or its SpatialContext
+    :rtype: Callable
+    """
+    if backend is None:
+        backend = STATISTIC_BACKENDS.get(name, "spatial_egt")
+    if backend == "native":
+        return NATIVE_STATISTICS[name]
+    if backend == "spatial_egt":
+        return DataFrameStatistic(SPATIAL_EGT_STATISTICS[name])
+    raise ValueError(f"Unknown backend {backend} for {name}")
+
+
+STATISTIC_REGISTRY = {name: get_statistic(name) for name in SPATIAL_EGT_STATISTICS}
+
 STATISTIC_PARAMS = {
     "NC_RS": {"radius": 10, "return_fs": True},
     "NC_SR": {"radius": 10, "return_fs": False},
@@ -109,4 +197,6 @@ STATISTIC_PARAMS = {
     "NN_RS": {"cell_type1": "resistant", "cell_type2": "sensitive"},
     "NN_SR": {"cell_type1": "sensitive", "cell_type2": "resistant"},
     "SES": {"side_length": 100},
-}
\ No newline at end of file
+    # exact, histogram, sinkhorn, or sliced, see data_processing/spatial_statistics/transport.py
+    "Wasserstein": {"method": "exact"},
+}